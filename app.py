@@ -1,16 +1,79 @@
 from __future__ import annotations
+
+import os
 from datetime import datetime, date
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Tuple, Union
 import re
-import pandas as pd
-from flask import Flask, jsonify, Response, request
+import sys
+import json
+import base64
+import gzip
+import hmac
+import tempfile
+import time
+import random
+import bisect
+import pstats
+import cProfile
+import hashlib
+import threading
+import heapq
+import itertools
+import importlib
+from collections import deque, OrderedDict
+from contextlib import contextmanager
+from functools import wraps
+
+from flask import Flask, jsonify, Response, request, g, has_request_context, redirect
+
+
+class _LazyModule:
+    """
+    import ثقيل يتأجل لين أول استخدام فعلي (أول np.xxx / pd.xxx)، وبعدها يستبدل نفسه
+    بالموديول الحقيقي في globals. كذا / و /healthz ما يدفعون وقت import لـ pandas عند الإقلاع
+    """
+    def __init__(self, name: str, alias: str):
+        self._name = name
+        self._alias = alias
+
+    def __getattr__(self, attr: str):
+        module = importlib.import_module(self._name)
+        globals()[self._alias] = module
+        return getattr(module, attr)
+
+np = _LazyModule("numpy", "np")
+pd = _LazyModule("pandas", "pd")
+
+try:
+    import brotli  # اختياري: لو موجود نقدّم br بجانب gzip
+except ImportError:
+    brotli = None
+
+try:
+    import orjson  # اختياري: JSON أسرع بكثير من json/jsonify
+except ImportError:
+    orjson = None
 
-app = Flask(__name__)
+try:
+    import msgpack  # اختياري: Accept: application/msgpack
+except ImportError:
+    msgpack = None
+
+def _gevent_patched() -> bool:
+    # gunicorn -k gevent يسوي monkey.patch_all قبل ما يستورد app
+    monkey = sys.modules.get("gevent.monkey")
+    return monkey is not None and monkey.is_module_patched("threading")
+
+GEVENT_PATCHED = _gevent_patched()
+
+app = Flask(__name__, static_folder=None)  # الملفات الثابتة نقدّمها بنفسنا (مضغوطة + hash)
 
 # =========================
 # الإعدادات
 # =========================
-EXCEL_PATH = r"C:\Users\itsno\Desktop\YazAn\تقرير تفاصيل الاعتراضات_تفصيلي_تقرير تفاصيل الاعتراضات_20251217_1405.xlsx"
+# ✅ لازم يكون ملف الإكسل داخل نفس فولدر المشروع (نفس فولدر app.py)
+# وسمّيه: تقرير_الاعتراضات.xlsx
+EXCEL_PATH = os.environ.get("EXCEL_PATH") or os.path.join(os.path.dirname(__file__), "تقرير_الاعتراضات.xlsx")
 
 CUTOFF_ISO = "2025-12-13"
 YEAR_OVERRIDE: Optional[int] = None
@@ -32,6 +95,70 @@ AJADA_KEYWORDS = [
 ]
 
 TOP_TYPES_LIMIT = 50  # لو تبين كل الأنواع خليها 999
+OTHER_TYPE_BUCKET = "نوع رقابه غير محدد"
+
+# فلتر: "ALL" أو قيمة وحدة أو قائمة قيم (muni=a&muni=b)
+FilterValue = Union[str, List[str]]
+
+# ✅ تحميل البيانات في الخلفية أول ما يشتغل السيرفر
+WARMUP_ON_BOOT = os.environ.get("WARMUP_ON_BOOT", "1") != "0"
+RETRY_AFTER_SEC = 2  # كم ثانية ينتظر المتصفح قبل ما يعيد الطلب وقت التحميل
+
+# ✅ Profiling عند الطلب (profile=1 أو X-Profile: 1) — يشتغل فقط لو PROFILE_TOKEN موجود
+# والتوكن ينرسل بالهيدر X-Profile-Token بس (مو في الرابط عشان ما يطلع في access logs والتقارير)
+PROFILE_TOKEN = os.environ.get("PROFILE_TOKEN", "")
+PROFILE_SAMPLE_RATE = float(os.environ.get("PROFILE_SAMPLE_RATE", "0"))  # نسبة الطلبات اللي تنعمل لها profile تلقائياً
+PROFILE_SLOW_SEC = float(os.environ.get("PROFILE_SLOW_SEC", "1.0"))  # نحتفظ فقط بالطلبات الأبطأ من كذا
+PROFILE_RING_SIZE = 20
+PROFILE_TOP_N = 30
+PROFILE_SAMPLE_INTERVAL = 0.001
+
+# ✅ تقسيم الكروت لصفحات (offset/limit) + كاش الترتيب لكل فلتر
+CARDS_PAGE_MAX = 200
+CARDS_CACHE_SIZE = 256
+
+# ✅ التصدير يمشي على الصفوف دفعة دفعة (الذاكرة ثابتة مهما كبر الناتج)
+EXPORT_CHUNK_ROWS = 5000
+# XLSX لازم ينبني كامل قبل أول بايت (zip)، فنحدّ عدد صفوفه؛ الأكبر منه يروح CSV (يتدفق فعلاً)
+EXPORT_XLSX_MAX_ROWS = int(os.environ.get("EXPORT_XLSX_MAX_ROWS", "200000"))
+
+# ✅ /rows: صفحات الصفوف بترتيب التاريخ مع cursor (بدون OFFSET)
+ROWS_PAGE_DEFAULT = 50
+ROWS_PAGE_MAX = 500
+ROWS_CACHE_SIZE = 32
+ROWS_DEFAULT_COLUMNS = [COL_DATE, COL_MUNI, COL_DEPT, COL_TYPE, COL_STATUS]
+
+# ✅ البحث النصي: فهرس مقلوب وقت التحميل على أعمدة النص (None = كل أعمدة النص ما عدا التاريخ)
+SEARCH_COLUMNS: Optional[List[str]] = None
+SEARCH_MAX_TERMS = 8
+
+# ✅ اقتراحات الفلاتر (autocomplete) بدل القوائم الكاملة
+SUGGEST_FIELDS = {"muni": COL_MUNI, "dept": COL_DEPT, "type": COL_TYPE}
+SUGGEST_LIMIT_DEFAULT = 10
+SUGGEST_LIMIT_MAX = 50
+
+# ✅ /rankings: ترتيب البلديات/الإدارات/الأنواع محسوب وقت التحميل
+RANKING_METRICS = ("total", "approved", "rate")
+RANKING_TOP_DEFAULT = 20
+RANKING_TOP_MAX = 500
+
+# ✅ /query: تجميع عام (group_by + filters + measures)
+QUERY_DIMS = ("muni", "dept", "type", "status", "quarter")
+QUERY_PLAN_CACHE_SIZE = 128
+QUERY_LIMIT_DEFAULT = 1000
+QUERY_LIMIT_MAX = 20000
+QUERY_DENSE_MAX_CELLS = 2_000_000  # فوقها نجمع بـ np.unique بدل bincount
+
+# ✅ /events (SSE): كل كم ثانية نشيك إذا ملف الإكسل تغيّر (0 = بدون مراقبة)، وكل كم ثانية ping
+DATASET_WATCH_SEC = float(os.environ.get("DATASET_WATCH_SEC", "10"))
+EVENTS_HEARTBEAT_SEC = 15
+# الحد الافتراضي حسب نوع الـ worker:
+# gevent: الاتصال الخامل greenlet رخيص، فالحد قريب من WEB_WORKER_CONNECTIONS
+# gthread: كل اتصال يحجز thread، فالحد ربع WEB_THREADS عشان /data و/healthz يلقون thread
+EVENTS_MAX_CLIENTS = int(os.environ.get("EVENTS_MAX_CLIENTS") or (
+    int(os.environ.get("WEB_WORKER_CONNECTIONS", "1000")) * 9 // 10 if GEVENT_PATCHED
+    else max(1, int(os.environ.get("WEB_THREADS", "16")) // 4)
+))
 
 
 # =========================
@@ -57,18 +184,168 @@ def quarter_labels_up_to(cutoff: date, year: int) -> List[str]:
     q = (cutoff.month - 1) // 3 + 1
     return [f"{year}-Q{i}" for i in range(1, q + 1)]
 
+def cutoff_date() -> date:
+    return datetime.strptime(CUTOFF_ISO, "%Y-%m-%d").date()
+
+def period() -> Tuple[int, List[str]]:
+    """
+    السنة وتسميات الأرباع لين تاريخ القطع (نفسها لكل الحسابات والفهارس)
+    """
+    cutoff = cutoff_date()
+    year = YEAR_OVERRIDE or cutoff.year
+    return year, quarter_labels_up_to(cutoff, year)
+
+_TOKEN_RE = re.compile(r"\w+")
+
+def tokenize(s) -> List[str]:
+    # نفس قواعد _norm (الألف/الياء/التاء المربوطة) وبعدين تقطيع لكلمات
+    return _TOKEN_RE.findall(_norm(s))
+
 def safe_slug(s: str) -> str:
     return re.sub(r"[^a-z0-9\u0600-\u06FF]+", "-", _norm(s)).strip("-") or "x"
 
 
+# =========================
+# Metrics (Prometheus text format)
+# =========================
+# ملاحظة: العدّادات داخل الـ process نفسه؛ مع أكثر من worker في gunicorn كل worker له أرقامه
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+_METRICS_META = {
+    "yazan_stage_seconds": ("histogram", "Wall time of data pipeline stages"),
+    "yazan_http_requests_total": ("counter", "HTTP requests by route and status"),
+    "yazan_http_request_duration_seconds": ("histogram", "HTTP request latency by route"),
+    "yazan_http_response_size_bytes": ("histogram", "HTTP response body size by route"),
+    "yazan_cache_requests_total": ("counter", "Cache lookups by cache and result (hit/miss)"),
+    "yazan_cache_hit_ratio": ("gauge", "hits / (hits + misses) per cache"),
+    "yazan_dataset_rows": ("gauge", "Rows in the prepared dataset"),
+    "yazan_dataset_ajada_removed_rows": ("gauge", "Rows removed by the ajada exclusion"),
+    "yazan_dataset_age_seconds": ("gauge", "Seconds since the dataset was loaded"),
+    "yazan_dataset_load_seconds": ("histogram", "Duration of full dataset (re)loads"),
+    "yazan_dataset_loads_total": ("counter", "Dataset (re)loads by result"),
+    "yazan_events_clients": ("gauge", "Open /events (SSE) connections"),
+    "yazan_events_rejected_total": ("counter", "/events connections refused because EVENTS_MAX_CLIENTS was reached"),
+    "yazan_events_published_total": ("counter", "Dataset versions broadcast to /events subscribers"),
+    "yazan_events_sent_total": ("counter", "SSE messages sent by event type"),
+    "yazan_coalesced_requests_total": ("counter", "Requests served by joining an identical in-flight computation (computations saved)"),
+}
+
+_metrics_lock = threading.Lock()
+_counters: Dict[tuple, float] = {}
+_gauges: Dict[tuple, float] = {}
+_histograms: Dict[tuple, Dict[str, Any]] = {}
+
+def _mkey(name: str, labels: Optional[Dict[str, str]]) -> tuple:
+    return (name, tuple(sorted(labels.items())) if labels else ())
+
+def inc(name: str, labels: Optional[Dict[str, str]] = None, value: float = 1) -> None:
+    k = _mkey(name, labels)
+    with _metrics_lock:
+        _counters[k] = _counters.get(k, 0) + value
+
+def set_gauge(name: str, value: float, labels: Optional[Dict[str, str]] = None) -> None:
+    with _metrics_lock:
+        _gauges[_mkey(name, labels)] = value
+
+def observe(name: str, value: float, labels: Optional[Dict[str, str]] = None, buckets=LATENCY_BUCKETS) -> None:
+    k = _mkey(name, labels)
+    i = bisect.bisect_left(buckets, value)
+    with _metrics_lock:
+        h = _histograms.get(k)
+        if h is None:
+            h = _histograms[k] = {"buckets": buckets, "counts": [0] * (len(buckets) + 1), "sum": 0.0}
+        h["counts"][i] += 1
+        h["sum"] += value
+
+# مراحل الطلب الحالي (تتعبى فقط وقت الـ profiling)
+_trace = threading.local()
+
+@contextmanager
+def stage_timer(stage: str):
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        dt = time.perf_counter() - t0
+        observe("yazan_stage_seconds", dt, {"stage": stage})
+        stages = getattr(_trace, "stages", None)
+        if stages is not None:
+            stages.append((stage, dt))
+
+def timed(stage: str):
+    def deco(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with stage_timer(stage):
+                return fn(*args, **kwargs)
+        return wrapper
+    return deco
+
+def _fmt_labels(labels: tuple, extra: Optional[tuple] = None) -> str:
+    items = list(labels) + list(extra or ())
+    if not items:
+        return ""
+    esc = lambda v: str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+    return "{" + ",".join(f'{k}="{esc(v)}"' for k, v in items) + "}"
+
+def _fmt_num(v: float) -> str:
+    return str(int(v)) if float(v).is_integer() else repr(float(v))
+
+def render_metrics() -> str:
+    with _metrics_lock:
+        counters = dict(_counters)
+        gauges = dict(_gauges)
+        hists = {k: {"buckets": h["buckets"], "counts": list(h["counts"]), "sum": h["sum"]} for k, h in _histograms.items()}
+
+    # نسبة الكاش تنحسب وقت العرض من عدّادات hit/miss
+    caches: Dict[str, Dict[str, float]] = {}
+    for (name, labels), v in counters.items():
+        if name == "yazan_cache_requests_total":
+            d = dict(labels)
+            caches.setdefault(d.get("cache", ""), {}).setdefault(d.get("result", ""), 0)
+            caches[d.get("cache", "")][d.get("result", "")] += v
+    for cache, r in caches.items():
+        total = r.get("hit", 0) + r.get("miss", 0)
+        gauges[_mkey("yazan_cache_hit_ratio", {"cache": cache})] = (r.get("hit", 0) / total) if total else 0.0
+
+    by_name: Dict[str, List[str]] = {}
+    for (name, labels), v in sorted(counters.items()) + sorted(gauges.items()):
+        by_name.setdefault(name, []).append(f"{name}{_fmt_labels(labels)} {_fmt_num(v)}")
+    for (name, labels), h in sorted(hists.items()):
+        lines = by_name.setdefault(name, [])
+        cum = 0
+        for le, c in zip(list(h["buckets"]) + ["+Inf"], h["counts"]):
+            cum += c
+            lines.append(f"{name}_bucket{_fmt_labels(labels, (('le', le if le == '+Inf' else _fmt_num(le)),))} {cum}")
+        lines.append(f"{name}_sum{_fmt_labels(labels)} {_fmt_num(h['sum'])}")
+        lines.append(f"{name}_count{_fmt_labels(labels)} {cum}")
+
+    out: List[str] = []
+    for name, lines in by_name.items():
+        kind, help_ = _METRICS_META.get(name, ("untyped", name))
+        out.append(f"# HELP {name} {help_}")
+        out.append(f"# TYPE {name} {kind}")
+        out.extend(lines)
+    return "\n".join(out) + "\n"
+
+
 # =========================
 # قراءة البيانات + حذف إجادة
 # =========================
+@timed("load_excel_full")
 def load_excel_full() -> pd.DataFrame:
+    if not os.path.exists(EXCEL_PATH):
+        raise FileNotFoundError(
+            f"ملف الإكسل غير موجود: {EXCEL_PATH}\n"
+            "تأكدي أنك وضعتي ملف (تقرير_الاعتراضات.xlsx) داخل نفس مجلد app.py ورفعتيه مع المشروع."
+        )
+
     df = pd.read_excel(EXCEL_PATH, engine="openpyxl")
     df.columns = df.columns.astype(str).str.strip()
     return df
 
+@timed("exclude_ajada_everywhere")
 def exclude_ajada_everywhere(df: pd.DataFrame) -> pd.DataFrame:
     """
     حذف أي صف يحتوي كلمة إجادة (بكل أشكالها) في أي عمود
@@ -85,12 +362,17 @@ def exclude_ajada_everywhere(df: pd.DataFrame) -> pd.DataFrame:
     out.attrs["ajada_removed_rows"] = removed
     return out
 
-def prepare_df() -> pd.DataFrame:
-    cutoff_dt = datetime.strptime(CUTOFF_ISO, "%Y-%m-%d").date()
-    year = YEAR_OVERRIDE or cutoff_dt.year
+@timed("prepare_df")
+def prepare_df(df_full: Optional[pd.DataFrame] = None) -> pd.DataFrame:
+    """
+    df_full: ملف الإكسل بعد حذف إجادة (لو None نقرأه ونحذف إجادة هنا)
+    """
+    cutoff_dt = cutoff_date()
+    year, _ = period()
 
-    df_full = load_excel_full()
-    df_full = exclude_ajada_everywhere(df_full)  # ✅ حذف إجادة قبل أي شيء
+    if df_full is None:
+        df_full = load_excel_full()
+        df_full = exclude_ajada_everywhere(df_full)  # ✅ حذف إجادة قبل أي شيء
 
     needed = [COL_DATE, COL_TYPE, COL_DEPT, COL_STATUS, COL_MUNI]
     missing = [c for c in needed if c not in df_full.columns]
@@ -108,9 +390,10 @@ def prepare_df() -> pd.DataFrame:
 
     df["_yq"] = df["_dt"].apply(lambda x: f"{year}-Q{quarter_of(x)}")
 
-    df["_muni_norm"] = df[COL_MUNI].map(_norm)
-    df["_dept_norm"] = df[COL_DEPT].map(_norm)
-    df["_type_norm"] = df[COL_TYPE].map(_norm)
+    # ✅ categorical = القيم مرمّزة كأرقام (الفلترة والمقارنة على الأكواد)
+    df["_muni_norm"] = df[COL_MUNI].map(_norm).astype("category")
+    df["_dept_norm"] = df[COL_DEPT].map(_norm).astype("category")
+    df["_type_norm"] = df[COL_TYPE].map(_norm).astype("category")
 
     df["_approved"] = df[COL_STATUS].astype(str).str.strip().eq(APPROVED_STATUS_VALUE)
 
@@ -121,12 +404,14 @@ def prepare_df() -> pd.DataFrame:
 # =========================
 # API
 # =========================
+@timed("build_options")
 def build_options(df: pd.DataFrame) -> Dict[str, List[str]]:
     munis = sorted({str(x).strip() for x in df[COL_MUNI].dropna().unique() if str(x).strip()})
     depts = sorted({str(x).strip() for x in df[COL_DEPT].dropna().unique() if str(x).strip()})
     types = sorted({str(x).strip() for x in df[COL_TYPE].dropna().unique() if str(x).strip()})
     return {"municipalities": munis, "departments": depts, "types": types}
 
+@timed("build_series")
 def build_series(g: pd.DataFrame, labels: List[str]) -> Dict[str, List[int]]:
     base = {l: 0 for l in labels}
     total_map = g.groupby("_yq").size().to_dict()
@@ -144,18 +429,92 @@ def build_series(g: pd.DataFrame, labels: List[str]) -> Dict[str, List[int]]:
 
     return {"total": [total[l] for l in labels], "approved": [approved[l] for l in labels]}
 
-def build_data(df: pd.DataFrame, muni: str, dept: str, type_: str) -> Dict[str, Any]:
-    cutoff_dt = datetime.strptime(CUTOFF_ISO, "%Y-%m-%d").date()
-    year = YEAR_OVERRIDE or cutoff_dt.year
-    labels = quarter_labels_up_to(cutoff_dt, year)
+FILTER_COLS = {"muni": "_muni_norm", "dept": "_dept_norm", "type": "_type_norm"}
+
+def filter_values(value: FilterValue) -> Optional[List[str]]:
+    """
+    None = الكل، وإلا قائمة القيم المختارة
+    """
+    values = [value] if isinstance(value, str) else list(value)
+    values = [v for v in values if v and v != "ALL"]
+    return values or None
+
+def isin_mask(s: pd.Series, values: List[str]) -> np.ndarray:
+    """
+    عضوية مجموعة وحدة على الأكواد: نحوّل القيم المطبّعة لأكواد الـ category ونقارن مرة وحدة
+    """
+    norms = [_norm(v) for v in values]
+    if isinstance(s.dtype, pd.CategoricalDtype):
+        wanted = s.cat.categories.get_indexer(norms)
+        return np.isin(s.cat.codes.to_numpy(), wanted[wanted >= 0])
+    return s.isin(norms).to_numpy()
+
+def filter_mask(df: pd.DataFrame, muni: FilterValue, dept: FilterValue, type_: FilterValue,
+                quarter: str = "ALL") -> Optional[np.ndarray]:
+    """
+    mask واحد لكل الفلاتر (None = بدون فلترة)
+    """
+    mask = None
+    for col, value in ((FILTER_COLS["muni"], muni), (FILTER_COLS["dept"], dept), (FILTER_COLS["type"], type_)):
+        values = filter_values(value)
+        if values is not None:
+            m = isin_mask(df[col], values)
+            mask = m if mask is None else (mask & m)
+    if quarter != "ALL":
+        m = (df["_yq"] == quarter).to_numpy()
+        mask = m if mask is None else (mask & m)
+    return mask
+
+def filter_df(df: pd.DataFrame, muni: FilterValue, dept: FilterValue, type_: FilterValue) -> pd.DataFrame:
+    mask = filter_mask(df, muni, dept, type_)
+    return df if mask is None else df[mask]
+
+def build_breakdown_cards(sub: pd.DataFrame, dim: str, values: List[str], labels: List[str]) -> List[Dict[str, Any]]:
+    """
+    كرت لكل قيمة مختارة في dim، كلها في مرور واحد:
+    (رقم القيمة × عدد الأرباع + رقم الربع) ثم bincount للإجمالي وللمقبول
+    """
+    col = sub[FILTER_COLS[dim]]
+    cats = col.cat.categories
+
+    titles: List[str] = []
+    sel_of_code = np.full(len(cats) + 1, -1, dtype=np.int64)  # آخر خانة لـ code = -1 (NaN)
+    for v in values:
+        k = cats.get_indexer([_norm(v)])[0]
+        if k >= 0 and sel_of_code[k] < 0:
+            sel_of_code[k] = len(titles)
+            titles.append(v)
+
+    nq = len(labels)
+    si = sel_of_code[col.cat.codes.to_numpy()]
+    qi = pd.Categorical(sub["_yq"], categories=labels).codes.astype(np.int64)
+    ok = (si >= 0) & (qi >= 0)
+    flat = si[ok] * nq + qi[ok]
+    size = max(1, len(titles)) * nq
+    total = np.bincount(flat, minlength=size).reshape(-1, nq)
+    approved = np.bincount(flat[sub["_approved"].to_numpy()[ok]], minlength=size).reshape(-1, nq)
+
+    cards = [
+        {
+            "title": t, "slug": safe_slug(t), "dim": dim, "value": t,
+            "series": {"total": total[i].tolist(), "approved": approved[i].tolist()},
+        }
+        for i, t in enumerate(titles) if total[i].sum() > 0
+    ]
+    cards.sort(key=lambda c: sum(c["series"]["total"]), reverse=True)
+    return cards
+
+@timed("build_data")
+def build_data(df: pd.DataFrame, muni: FilterValue, dept: FilterValue, type_: FilterValue) -> Dict[str, Any]:
+    """
+    لو فيه بُعد مختار له أكثر من قيمة (أول واحد من بلدية/إدارة/نوع) الكروت تكون لكل قيمة منه
+    """
+    year, labels = period()
+    breakdown = next((dim for dim, v in (("muni", muni), ("dept", dept), ("type", type_))
+                      if len(filter_values(v) or []) > 1), None)
 
-    sub = df
-    if muni != "ALL":
-        sub = sub[sub["_muni_norm"] == _norm(muni)]
-    if dept != "ALL":
-        sub = sub[sub["_dept_norm"] == _norm(dept)]
-    if type_ != "ALL":
-        sub = sub[sub["_type_norm"] == _norm(type_)]
+    with stage_timer("build_data.filter"):
+        sub = filter_df(df, muni, dept, type_)
 
     if sub.empty:
         return {
@@ -166,19 +525,36 @@ def build_data(df: pd.DataFrame, muni: str, dept: str, type_: str) -> Dict[str,
 
     cards: List[Dict[str, Any]] = []
 
-    if type_ == "ALL":
-        counts = sub.groupby(COL_TYPE).size().sort_values(ascending=False)
-        top = list(counts.head(TOP_TYPES_LIMIT).index.astype(str))
-
-        sub2 = sub.copy()
-        sub2["_bucket"] = sub2[COL_TYPE].astype(str).apply(lambda x: x if x in top else "نوع رقابه غير محدد")
-
-        for name, g in sub2.groupby("_bucket"):
-            cards.append({"title": str(name), "slug": safe_slug(str(name)), "series": build_series(g, labels)})
-
-        cards.sort(key=lambda c: sum(c["series"]["total"]), reverse=True)
+    if breakdown is not None:
+        with stage_timer("build_data.breakdown"):
+            cards = build_breakdown_cards(sub, breakdown, filter_values({"muni": muni, "dept": dept, "type": type_}[breakdown]), labels)
+    elif filter_values(type_) is None:
+        with stage_timer("build_data.groupby"):
+            # stable: التعادل على حد TOP_TYPES_LIMIT يُحسم بترتيب الاسم (نفس الحساب المحلي من /cube)
+            counts = sub.groupby(COL_TYPE).size().sort_values(ascending=False, kind="stable")
+            top = list(counts.head(TOP_TYPES_LIMIT).index.astype(str))
+
+        with stage_timer("build_data.bucketing"):
+            sub2 = sub.copy()
+            sub2["_bucket"] = sub2[COL_TYPE].astype(str).apply(lambda x: x if x in top else OTHER_TYPE_BUCKET)
+
+        with stage_timer("build_data.series"):
+            for name, grp in sub2.groupby("_bucket"):
+                name = str(name)
+                cards.append({
+                    "title": name, "slug": safe_slug(name), "dim": "type",
+                    "value": None if name == OTHER_TYPE_BUCKET else name,
+                    "series": build_series(grp, labels),
+                })
+
+            cards.sort(key=lambda c: sum(c["series"]["total"]), reverse=True)
     else:
-        cards.append({"title": type_, "slug": safe_slug(type_), "series": build_series(sub, labels)})
+        type_value = filter_values(type_)[0]
+        with stage_timer("build_data.series"):
+            cards.append({
+                "title": type_value, "slug": safe_slug(type_value), "dim": "type", "value": type_value,
+                "series": build_series(sub, labels),
+            })
 
     return {
         "config": {"labels": labels, "year": year, "cutoff": CUTOFF_ISO, "muni": muni, "dept": dept, "type": type_},
@@ -197,10 +573,7 @@ HTML = r"""
   <meta charset="utf-8"/>
   <meta name="viewport" content="width=device-width,initial-scale=1"/>
   <title>لوحة الاعتراضات</title>
-  <script src="https://cdn.jsdelivr.net/npm/chart.js@4.4.1/dist/chart.umd.min.js"></script>
-  <link rel="preconnect" href="https://fonts.googleapis.com">
-  <link rel="preconnect" href="https://fonts.gstatic.com" crossorigin>
-  <link href="https://fonts.googleapis.com/css2?family=IBM+Plex+Sans+Arabic:wght@400;500;600;700&display=swap" rel="stylesheet">
+  <script src="{{CHART_JS_URL}}"></script>
 
   <style>
     :root{
@@ -266,6 +639,25 @@ HTML = r"""
     }
     .select option, .select optgroup{ background: var(--option-bg); color: var(--option-fg); }
 
+    .ac{position:relative}
+    .ac .select{background-image:none;padding:10px 12px}
+    .chips{display:flex;flex-wrap:wrap;gap:6px;margin-bottom:6px}
+    .chips:empty{display:none}
+    .chip{
+      display:inline-flex;align-items:center;gap:6px;padding:3px 10px;border-radius:999px;font-size:12px;
+      background:rgba(0,123,105,.22);border:1px solid var(--select-border);
+    }
+    .chip button{background:none;border:0;color:inherit;cursor:pointer;font-size:14px;line-height:1;padding:0}
+    .ac .select::placeholder{color:var(--text-primary);opacity:.85}
+    .acList{
+      display:none; position:absolute; top:calc(100% + 4px); right:0; left:0; z-index:200;
+      list-style:none; max-height:320px; overflow:auto;
+      background:var(--option-bg); border:1px solid var(--select-border); border-radius:12px;
+      box-shadow:var(--shadow);
+    }
+    .acList li{display:flex;justify-content:space-between;gap:10px;padding:8px 12px;cursor:pointer;font-size:13px}
+    .acList li.active, .acList li:hover{background:rgba(0,123,105,.22)}
+
     .btn{
       background:rgba(0,123,105,.22);
       border:1px solid rgba(0,123,105,.45);
@@ -305,6 +697,15 @@ HTML = r"""
     .kpiStatLabel{font-size:11px;color:var(--text-muted);margin-bottom:4px}
     .kpiStatValue{font-size:16px;font-weight:900}
     .muted{color:var(--text-secondary);font-size:12px}
+    .progress{height:8px;margin-top:12px;border-radius:8px;background:var(--remaining);overflow:hidden}
+    .progressBar{height:100%;background:var(--approved);transition:width .4s ease}
+    .sentinel{text-align:center;padding:12px}
+    .btnGhost{background:transparent;border-color:var(--select-border)}
+    .tableWrap{max-height:420px;overflow:auto;margin-top:8px}
+    .drillTable{width:100%;border-collapse:collapse;font-size:12px}
+    .drillTable th,.drillTable td{padding:6px 8px;border-bottom:1px solid var(--border);text-align:right;white-space:nowrap}
+    .drillTable th{position:sticky;top:0;background:var(--bg-card);color:var(--text-secondary)}
+    .drillFoot{margin-top:10px;display:flex;gap:8px;align-items:center}
   </style>
 </head>
 
@@ -316,10 +717,12 @@ HTML = r"""
         <div class="titleMain">لوحة الاعتراضات</div>
         <div class="subTitle" id="subtitle"></div>
         <div class="filters">
-          <select id="selMuni" class="select"></select>
-          <select id="selDept" class="select"></select>
-          <select id="selType" class="select"></select>
+          <div class="ac"><input id="selMuni" class="select" data-field="muni" placeholder="كل البلديات" autocomplete="off"></div>
+          <div class="ac"><input id="selDept" class="select" data-field="dept" placeholder="كل الإدارات" autocomplete="off"></div>
+          <div class="ac"><input id="selType" class="select" data-field="type" placeholder="كل أنواع الرقابة" autocomplete="off"></div>
           <button class="btn" id="btnApply">تطبيق</button>
+          <button class="btn btnGhost" id="btnCsv">تصدير CSV</button>
+          <button class="btn btnGhost" id="btnXlsx">تصدير Excel</button>
         </div>
       </div>
       <div class="muted" id="ajadaInfo"></div>
@@ -333,14 +736,33 @@ HTML = r"""
 
 <script>
 let charts = [];
+const PAGE_SIZE = 8;
+let loadSeq = 0;        // يتغير مع كل تطبيق فلتر عشان نتجاهل الصفحات القديمة
+let chartObserver = null;
+let pageObserver = null;
+let currentFilters = {muni:"ALL", dept:"ALL", type:"ALL"};
+const OTHER_BUCKET = "نوع رقابه غير محدد";
+const DRILL_PAGE = 50;
+let eventSource = null;
+// ✅ التحديث الحي اختياري (شاشات العرض): /?live=1 — التبويبات العادية ما تفتح /events
+const LIVE = new URLSearchParams(location.search).get("live") === "1";
+const EVENTS_RETRY_MS = 60000;  // لو السيرفر رفض (503 عند الحد) نعيد المحاولة بعد دقيقة
+let cube = null;          // المكعّب من /cube (لو موجود الفلترة تصير محلية)
+let localPayload = null;  // نتيجة الفلتر الحالي محسوبة من المكعّب
+
+function esc(s){
+  return String(s ?? "").replace(/[&<>"']/g, ch => ({"&":"&amp;","<":"&lt;",">":"&gt;",'"':"&quot;","'":"&#39;"}[ch]));
+}
 
 function destroyCharts(){
   charts.forEach(c => c && c.destroy());
   charts = [];
+  if(chartObserver){ chartObserver.disconnect(); chartObserver = null; }
+  if(pageObserver){ pageObserver.disconnect(); pageObserver = null; }
 }
 function sum(arr){ return arr.reduce((a,b)=>a+b,0); }
 
-function buildSingleBarWithApprovedPart(canvas, labels, total, approved){
+function buildSingleBarWithApprovedPart(canvas, labels, total, approved, onBar){
   const remaining = total.map((t,i)=> Math.max(0, t - approved[i]));
   const qLabels = labels.map(x => (x.split("-")[1] || x));
 
@@ -359,6 +781,8 @@ function buildSingleBarWithApprovedPart(canvas, labels, total, approved){
     options: {
       responsive:true,
       maintainAspectRatio:false,
+      onClick:(evt, els)=> { if(onBar && els.length) onBar(els[0].index); },
+      onHover:(evt, els)=> { if(onBar) evt.native.target.style.cursor = els.length ? "pointer" : "default"; },
       plugins:{
         legend:{ labels:{ filter:(item)=> item.text === "المقبولة" } },
         tooltip:{
@@ -382,50 +806,175 @@ function buildSingleBarWithApprovedPart(canvas, labels, total, approved){
   });
 }
 
-function makeOption(sel, value, text){
-  const opt = document.createElement("option");
-  opt.value = value;
-  opt.textContent = text;
-  sel.appendChild(opt);
+const STAGE_LABELS = {
+  read_excel: "قراءة ملف الإكسل",
+  exclude_ajada: "استبعاد إجادة",
+  prepare: "تجهيز البيانات",
+  search_index: "بناء فهرس البحث",
+};
+
+function sleep(ms){ return new Promise(res => setTimeout(res, ms)); }
+
+function showLoading(j){
+  const rows = document.getElementById("rows");
+  const pct = Math.max(0, Math.min(100, j?.progress ?? 0));
+  const stage = STAGE_LABELS[j?.stage] || "";
+  rows.innerHTML = `
+    <div class="card">
+      <div class="title">جاري تحميل البيانات… ${pct}%</div>
+      <div class="muted" style="margin-top:6px">${stage}</div>
+      <div class="progress"><div class="progressBar" style="width:${pct}%"></div></div>
+    </div>`;
 }
 
-async function loadOptions(){
-  const r = await fetch("/options", {cache:"no-store"});
-  let j = null;
-  try { j = await r.json(); }
-  catch(e){
-    throw new Error("فشل قراءة JSON من /options (غالباً فيه خطأ 500 في السيرفر).");
-  }
-  if(!r.ok){
-    throw new Error(j?.error || "خطأ غير معروف في /options");
+// ✅ يعيد الطلب تلقائياً لو السيرفر رجّع 503 (البيانات لسه تتحمل)
+async function fetchJSON(url, name){
+  while(true){
+    const r = await fetch(url, {cache:"no-store"});
+    let j = null;
+    try { j = await r.json(); }
+    catch(e){
+      throw new Error(`فشل قراءة JSON من ${name} (غالباً فيه خطأ 500 في السيرفر).`);
+    }
+    if(r.status === 503 && j?.loading){
+      showLoading(j);
+      const wait = parseInt(r.headers.get("Retry-After") || "2", 10);
+      await sleep(Math.max(1, wait) * 1000);
+      continue;
+    }
+    if(!r.ok){
+      throw new Error(j?.error || `خطأ غير معروف في ${name}`);
+    }
+    return j;
   }
+}
 
-  const selMuni = document.getElementById("selMuni");
-  const selDept = document.getElementById("selDept");
-  const selType = document.getElementById("selType");
+// ✅ اختيار متعدد: القيم = الـ chips + النص المكتوب، ولا شي = الكل
+function filterValues(id){
+  const input = document.getElementById(id);
+  const values = [...input.parentElement.querySelectorAll(".chip")].map(c => c.dataset.value);
+  const typed = input.value.trim();
+  if(typed && !values.includes(typed)) values.push(typed);
+  return values.length ? values : ["ALL"];
+}
 
-  selMuni.innerHTML = ""; selDept.innerHTML = ""; selType.innerHTML = "";
+function currentSelection(){
+  return {muni: filterValues("selMuni"), dept: filterValues("selDept"), type: filterValues("selType")};
+}
 
-  makeOption(selMuni, "ALL", "كل البلديات");
-  (j.municipalities || []).forEach(x => makeOption(selMuni, x, x));
+// ✅ المصفوفات تنرسل كـ params مكررة (muni=a&muni=b)
+function toQuery(params){
+  const qs = new URLSearchParams();
+  Object.entries(params).forEach(([k, v]) => {
+    if(v === null || v === undefined) return;
+    (Array.isArray(v) ? v : [v]).forEach(x => qs.append(k, x));
+  });
+  return qs;
+}
 
-  makeOption(selDept, "ALL", "كل الإدارات");
-  (j.departments || []).forEach(x => makeOption(selDept, x, x));
+// ✅ autocomplete: الاقتراحات من /options/suggest (تطبيع الهمزات والتاء المربوطة على السيرفر)
+function setupAutocomplete(input){
+  const field = input.dataset.field;
+  const list = document.createElement("ul");
+  list.className = "acList";
+  input.parentElement.appendChild(list);
+  const chips = document.createElement("div");
+  chips.className = "chips";
+  input.before(chips);
+
+  let items = [];
+  let active = -1;
+  let timer = null;
+  let seq = 0;
+
+  const close = () => { list.style.display = "none"; items = []; active = -1; };
+  const addChip = (v) => {
+    if([...chips.children].some(c => c.dataset.value === v)) return;
+    const chip = document.createElement("span");
+    chip.className = "chip";
+    chip.dataset.value = v;
+    chip.innerHTML = `${esc(v)}<button type="button" aria-label="حذف">×</button>`;
+    chip.querySelector("button").addEventListener("click", () => { chip.remove(); onFilterChange(); });
+    chips.appendChild(chip);
+  };
+  const choose = (v) => { addChip(v); input.value = ""; close(); onFilterChange(); };
+  const highlight = () => {
+    [...list.children].forEach((li, i) => li.classList.toggle("active", i === active));
+  };
+  const show = (suggestions) => {
+    items = suggestions;
+    active = -1;
+    list.innerHTML = suggestions.map((s, i) =>
+      `<li data-i="${i}"><span>${esc(s.value)}</span><span class="muted">${s.count.toLocaleString("en-US")}</span></li>`
+    ).join("");
+    list.style.display = suggestions.length ? "block" : "none";
+  };
+  const query = async () => {
+    const my = ++seq;
+    // الحقل نفسه ما يقيّد اقتراحاته (عشان نقدر نضيف قيم ثانية)
+    const qs = toQuery({...currentSelection(), [field]: "ALL", field, q: input.value.trim(), limit: 12});
+    try{
+      const r = await fetch(`/options/suggest?${qs.toString()}`);
+      if(!r.ok) return;  // وقت التحميل (503) نتجاهل بهدوء
+      const j = await r.json();
+      if(my === seq && document.activeElement === input) show(j.suggestions || []);
+    }catch(e){ /* تجاهل */ }
+  };
+
+  input.addEventListener("input", () => { clearTimeout(timer); timer = setTimeout(query, 120); });
+  input.addEventListener("focus", query);
+  input.addEventListener("blur", () => setTimeout(close, 150));
+  input.addEventListener("keydown", (e) => {
+    if(e.key === "ArrowDown" && items.length){ active = (active + 1) % items.length; highlight(); e.preventDefault(); }
+    else if(e.key === "ArrowUp" && items.length){ active = (active - 1 + items.length) % items.length; highlight(); e.preventDefault(); }
+    else if(e.key === "Enter"){
+      if(active >= 0){ choose(items[active].value); e.preventDefault(); }
+      else if(input.value.trim()){ choose(input.value.trim()); e.preventDefault(); }
+      else { close(); document.getElementById("btnApply").click(); }
+    }
+    else if(e.key === "Backspace" && !input.value && chips.lastElementChild){ chips.lastElementChild.remove(); onFilterChange(); }
+    else if(e.key === "Escape"){ close(); }
+  });
+  list.addEventListener("mousedown", (e) => {
+    const li = e.target.closest("li");
+    if(!li) return;
+    e.preventDefault();
+    choose(items[+li.dataset.i].value);
+  });
+}
 
-  makeOption(selType, "ALL", "كل أنواع الرقابة");
-  (j.types || []).forEach(x => makeOption(selType, x, x));
+document.querySelectorAll(".ac input").forEach(setupAutocomplete);
+
+// ✅ الرسم فقط لما الكرت يدخل الشاشة
+function observeChart(section, draw){
+  if(!("IntersectionObserver" in window)){ charts.push(draw()); return; }
+  if(!chartObserver){
+    chartObserver = new IntersectionObserver(entries => {
+      entries.forEach(en => {
+        if(!en.isIntersecting) return;
+        chartObserver.unobserve(en.target);
+        const fn = en.target._draw;
+        en.target._draw = null;
+        if(fn) charts.push(fn());
+      });
+    }, {rootMargin: "200px 0px"});
+  }
+  section._draw = draw;
+  chartObserver.observe(section);
 }
 
-function renderCards(payload){
+function renderCards(payload, append){
   const rows = document.getElementById("rows");
-  rows.innerHTML = "";
-  destroyCharts();
+  if(!append){
+    rows.innerHTML = "";
+    destroyCharts();
+  }
 
   // ✅ حذف السطرين اللي طلبتي
   document.getElementById("subtitle").textContent = "";
   document.getElementById("ajadaInfo").textContent = "";
 
-  if(!payload.cards || payload.cards.length === 0){
+  if(!append && (!payload.cards || payload.cards.length === 0)){
     const empty = document.createElement("div");
     empty.className = "card";
     empty.textContent = "لا توجد بيانات حسب التصفية الحالية.";
@@ -440,31 +989,31 @@ function renderCards(payload){
     const total = card.series.total;
     const approved = card.series.approved;
 
-    const a = sum(approved);
-    const t = sum(total);
-    const rate = t ? ((a/t)*100).toFixed(1) : "0.0";
+    const {a, t, rate} = kpiNumbers(total, approved);
 
     const section = document.createElement("section");
     section.className = "row";
+    section.dataset.title = card.title;
+    section._series = {total, approved};  // نفس المصفوفات اللي يقرأ منها الرسم (للتحديث في مكانه)
 
     section.innerHTML = `
       <div class="card">
-        <div class="chartHead"><div class="title">${card.title}</div></div>
-        <div class="canvasWrap"><canvas id="cv-${card.slug}"></canvas></div>
+        <div class="chartHead"><div class="title">${esc(card.title)}</div></div>
+        <div class="canvasWrap"><canvas></canvas></div>
       </div>
 
       <aside class="card">
         <div class="kpi">
           <div class="kpiTitle">عدد الاعتراضات المقبولة</div>
-          <div class="kpiValue">${a.toLocaleString("en-US")}</div>
+          <div class="kpiValue" data-kpi="a">${a.toLocaleString("en-US")}</div>
           <div class="kpiStats">
             <div class="kpiStat">
               <div class="kpiStatLabel">الإجمالي</div>
-              <div class="kpiStatValue">${t.toLocaleString("en-US")}</div>
+              <div class="kpiStatValue" data-kpi="t">${t.toLocaleString("en-US")}</div>
             </div>
             <div class="kpiStat">
               <div class="kpiStatLabel">نسبة القبول</div>
-              <div class="kpiStatValue">${rate}%</div>
+              <div class="kpiStatValue" data-kpi="rate">${rate}%</div>
             </div>
           </div>
         </div>
@@ -473,29 +1022,328 @@ function renderCards(payload){
 
     rows.appendChild(section);
 
-    const canvas = document.getElementById(`cv-${card.slug}`);
-    charts.push(buildSingleBarWithApprovedPart(canvas, labels, total, approved));
+    const canvas = section.querySelector("canvas");
+    // ✅ الضغط على عمود الربع يفتح صفوف الاعتراضات (كرت "غير محدد" يجمع أكثر من نوع فما له تفاصيل)
+    const drillValue = card.value ?? (card.title === OTHER_BUCKET ? null : card.title);
+    const drillDim = card.dim || "type";
+    const onBar = drillValue === null ? null
+      : (i => openDrill(section, drillDim, drillValue, labels[i]).catch(e => alert(e.message)));
+    observeChart(section, () => (section._chart = buildSingleBarWithApprovedPart(canvas, labels, total, approved, onBar)));
   });
 }
 
-async function loadData(){
-  const muni = document.getElementById("selMuni").value;
-  const dept = document.getElementById("selDept").value;
-  const type = document.getElementById("selType").value;
-
-  const qs = new URLSearchParams({muni, dept, type}).toString();
-  const r = await fetch(`/data?${qs}`, {cache:"no-store"});
-  let j = null;
-  try { j = await r.json(); }
-  catch(e){
-    throw new Error("فشل قراءة JSON من /data (غالباً فيه خطأ 500 في السيرفر).");
+function kpiNumbers(total, approved){
+  const a = sum(approved);
+  const t = sum(total);
+  return {a, t, rate: t ? ((a/t)*100).toFixed(1) : "0.0"};
+}
+
+// ✅ تحديث كرت موجود بدون إعادة رسم الصفحة (الأرقام + الرسم في مكانه)
+function updateCardInPlace(section, card){
+  const s = section._series;
+  s.total.splice(0, s.total.length, ...card.series.total);
+  s.approved.splice(0, s.approved.length, ...card.series.approved);
+
+  const {a, t, rate} = kpiNumbers(s.total, s.approved);
+  section.querySelector('[data-kpi="a"]').textContent = a.toLocaleString("en-US");
+  section.querySelector('[data-kpi="t"]').textContent = t.toLocaleString("en-US");
+  section.querySelector('[data-kpi="rate"]').textContent = `${rate}%`;
+
+  const chart = section._chart;
+  if(chart){
+    const remaining = chart.data.datasets[1].data;
+    remaining.splice(0, remaining.length, ...s.total.map((x, i) => Math.max(0, x - s.approved[i])));
+    chart.update();
+  }
+}
+
+// ✅ delta من /events: لو تغيّرت الكروت المعروضة نفسها (أرباع/حذف/ترتيب) نعيد التحميل، وإلا نحدّث في مكانه
+function applyDelta(d){
+  const sections = [...document.querySelectorAll("#rows section.row")];
+  const shown = sections.map(s => s.dataset.title);
+  const structural = d.labels || d.removed.some(t => shown.includes(t))
+    || shown.some((t, i) => d.order[i] !== t);
+  if(structural){
+    loadData().catch(e => console.error(e));
+    return;
+  }
+  const byTitle = new Map(sections.map(s => [s.dataset.title, s]));
+  d.changed.forEach(card => {
+    const section = byTitle.get(card.title);
+    if(section) updateCardInPlace(section, card);
+  });
+}
+
+function subscribeEvents(filters){
+  if(!LIVE || !("EventSource" in window)) return;
+  if(eventSource) eventSource.close();
+  const es = eventSource = new EventSource(`/events?${toQuery(filters).toString()}`);
+  es.addEventListener("error", () => {
+    // EventSource ما يعيد المحاولة بعد رد غير 200 (مثلاً 503 لما توصل الاتصالات للحد)
+    if(es.readyState !== EventSource.CLOSED) return;
+    setTimeout(() => { if(eventSource === es) subscribeEvents(currentFilters); }, EVENTS_RETRY_MS);
+  });
+  es.addEventListener("update", e => {
+    const d = JSON.parse(e.data);
+    if(cube && cube.version !== d.version) cube = null;  // المكعّب القديم ما عاد يصلح
+    applyDelta(d);
+    if(!cube) loadCube(d.version);
+  });
+}
+
+// ✅ تفاصيل الربع: صفحات من /rows بالـ cursor
+async function openDrill(section, dim, value, quarter){
+  let panel = section.nextElementSibling;
+  if(!panel || !panel.classList.contains("drill")){
+    panel = document.createElement("div");
+    panel.className = "card drill";
+    section.after(panel);
+  }
+  panel.innerHTML = `
+    <div class="chartHead">
+      <div class="title">${esc(value)} — ${esc(quarter)}</div>
+      <button class="btn btnGhost">إغلاق</button>
+    </div>
+    <div class="tableWrap"><table class="drillTable"><thead></thead><tbody></tbody></table></div>
+    <div class="drillFoot muted"></div>`;
+  panel.querySelector(".chartHead button").addEventListener("click", () => panel.remove());
+
+  const thead = panel.querySelector("thead");
+  const tbody = panel.querySelector("tbody");
+  const foot = panel.querySelector(".drillFoot");
+  const params = {...currentFilters, [dim]: value, quarter, limit: DRILL_PAGE};
+  let cursor = null;
+  let shown = 0;
+
+  const more = async () => {
+    const qs = toQuery(params);
+    if(cursor) qs.set("cursor", cursor);
+    const j = await fetchJSON(`/rows?${qs.toString()}`, "/rows");
+    if(!thead.children.length){
+      thead.innerHTML = `<tr>${j.columns.map(c => `<th>${esc(c)}</th>`).join("")}</tr>`;
+    }
+    tbody.insertAdjacentHTML("beforeend", j.rows.map(r =>
+      `<tr>${j.columns.map(c => `<td>${esc(r[c])}</td>`).join("")}</tr>`).join(""));
+    shown += j.rows.length;
+    cursor = j.next_cursor;
+
+    foot.innerHTML = `${shown.toLocaleString("en-US")} / ${j.total.toLocaleString("en-US")}`;
+    if(cursor){
+      const btn = document.createElement("button");
+      btn.className = "btn btnGhost";
+      btn.textContent = "المزيد";
+      btn.addEventListener("click", () => { btn.disabled = true; more().catch(e => alert(e.message)); });
+      foot.append(" ", btn);
+    }
+  };
+  await more();
+}
+
+// ✅ الصفحة التالية من الكروت تنجلب لما نوصل لآخر القائمة
+function watchNextPage(filters, nextOffset, seq){
+  const rows = document.getElementById("rows");
+  if(nextOffset === null || nextOffset === undefined) return;
+
+  const sentinel = document.createElement("div");
+  sentinel.className = "muted sentinel";
+  sentinel.textContent = "…";
+  rows.appendChild(sentinel);
+
+  const more = async () => {
+    if(pageObserver){ pageObserver.disconnect(); pageObserver = null; }
+    try{
+      await loadPage(filters, nextOffset, seq);
+    }catch(e){
+      sentinel.textContent = `خطأ: ${e.message}`;
+      return;
+    }
+    sentinel.remove();
+  };
+
+  if(!("IntersectionObserver" in window)){ more(); return; }
+  pageObserver = new IntersectionObserver(entries => {
+    if(entries.some(en => en.isIntersecting)) more();
+  }, {rootMargin: "400px 0px"});
+  pageObserver.observe(sentinel);
+}
+
+// ✅ نفس _norm في السيرفر (الهمزات/الألف المقصورة/التاء المربوطة)
+function normAr(s){
+  return String(s ?? "").trim()
+    .replace(/[أإآ]/g, "ا").replace(/ى/g, "ي").replace(/ة/g, "ه")
+    .toLowerCase();
+}
+
+function decodeColumn(col){
+  const bin = atob(col.data);
+  const bytes = new Uint8Array(bin.length);
+  for(let i = 0; i < bin.length; i++) bytes[i] = bin.charCodeAt(i);
+  const Typed = {uint8: Uint8Array, uint16: Uint16Array, uint32: Uint32Array}[col.dtype];
+  return new Typed(bytes.buffer);
+}
+
+// ✅ المكعّب يتخزّن بكاش المتصفح: /cube يحوّل لـ /cube?v=<version> (immutable)، ولو فشل نكمل على /data
+async function loadCube(version){
+  try{
+    const r = await fetch(version ? `/cube?v=${encodeURIComponent(version)}` : "/cube");
+    if(!r.ok) return;
+    const j = await r.json();
+    const cols = {};
+    Object.entries(j.columns).forEach(([k, col]) => { cols[k] = decodeColumn(col); });
+    const norms = {};
+    Object.entries(j.dims).forEach(([dim, d]) => { norms[dim] = new Map(d.norms.map((s, i) => [s, i])); });
+    cube = {...j, cols, norms};
+  }catch(e){
+    console.error(e);
+  }
+}
+
+// ✅ مع المكعّب تغيير الفلتر يتطبق فوراً (بدون زر تطبيق)
+function onFilterChange(){
+  if(cube) loadData().catch(e => console.error(e));
+}
+
+function compareStr(a, b){ return a < b ? -1 : a > b ? 1 : 0; }
+
+// ✅ نسخة محلية من build_data على المكعّب: نفس الكروت (تفصيل متعدد / أعلى الأنواع + "غير محدد" / نوع واحد)
+function cubeBuildData(c, filters){
+  const nq = c.labels.length;
+  const typeDim = c.dims.type;
+  const selected = {};
+  let breakdown = null;
+  ["muni", "dept", "type"].forEach(dim => {
+    const values = (filters[dim] || []).filter(v => v && v !== "ALL");
+    if(!values.length) return;
+    selected[dim] = values;
+    if(breakdown === null && values.length > 1) breakdown = dim;
+  });
+
+  // لكل بُعد: رقم القيمة المطبّعة → رقم الاختيار (أول قيمة بنفس التطبيع)، -1 = مو مختار
+  const pick = {};
+  const titles = {};
+  Object.entries(selected).forEach(([dim, values]) => {
+    const m = new Int32Array(c.dims[dim].norms.length).fill(-1);
+    titles[dim] = [];
+    values.forEach(v => {
+      const k = c.norms[dim].get(normAr(v));
+      if(k !== undefined && m[k] < 0){ m[k] = titles[dim].length; titles[dim].push(v); }
+    });
+    pick[dim] = m;
+  });
+  const normOf = {muni: i => i, dept: i => i, type: i => typeDim.label_norm[i]};
+
+  const groups = new Map();  // عنوان الكرت → {total, approved}
+  const typeCounts = new Map();
+  const add = (key, q, a, n) => {
+    let gr = groups.get(key);
+    if(!gr){ gr = {total: new Array(nq).fill(0), approved: new Array(nq).fill(0)}; groups.set(key, gr); }
+    gr.total[q] += n;
+    if(a) gr.approved[q] += n;
+  };
+
+  const {muni, dept, type, quarter, approved, n} = c.cols;
+  let matched = 0;
+  for(let i = 0; i < c.size; i++){
+    const code = {muni: muni[i], dept: dept[i], type: type[i]};
+    let sel = -1, ok = true;
+    for(const dim in pick){
+      const s = pick[dim][normOf[dim](code[dim])];
+      if(s < 0){ ok = false; break; }
+      if(dim === breakdown) sel = s;
+    }
+    if(!ok) continue;
+    matched += n[i];
+    if(breakdown !== null) add(sel, quarter[i], approved[i], n[i]);
+    else if(!selected.type){
+      add(type[i], quarter[i], approved[i], n[i]);
+      if(type[i] !== typeDim.null){
+        const title = typeDim.labels[type[i]];
+        typeCounts.set(title, (typeCounts.get(title) || 0) + n[i]);
+      }
+    }
+    else add(0, quarter[i], approved[i], n[i]);
   }
-  if(!r.ok){
-    throw new Error(j?.error || "خطأ غير معروف في /data");
+
+  let cards = [];
+  if(matched === 0){
+    cards = [];
+  }else if(breakdown !== null){
+    cards = titles[breakdown].map((t, s) => ({t, s, gr: groups.get(s)}))
+      .filter(x => x.gr && sum(x.gr.total) > 0)
+      .map(({t, gr}) => ({title: t, dim: breakdown, value: t, series: gr}));
+  }else if(!selected.type){
+    const top = new Set([...typeCounts.entries()]
+      .sort((x, y) => compareStr(x[0], y[0])).sort((x, y) => y[1] - x[1])
+      .slice(0, c.top_types_limit).map(x => x[0]));
+    const buckets = new Map();
+    groups.forEach((gr, code) => {
+      const label = typeDim.labels[code];
+      const name = top.has(label) ? label : c.other_bucket;
+      let b = buckets.get(name);
+      if(!b){ b = {total: new Array(nq).fill(0), approved: new Array(nq).fill(0)}; buckets.set(name, b); }
+      gr.total.forEach((x, q) => { b.total[q] += x; b.approved[q] += gr.approved[q]; });
+    });
+    cards = [...buckets.keys()].sort(compareStr).map(name => ({
+      title: name, dim: "type", value: name === c.other_bucket ? null : name, series: buckets.get(name),
+    }));
+  }else{
+    cards = [{title: selected.type[0], dim: "type", value: selected.type[0], series: groups.get(0)}];
+  }
+  cards.sort((x, y) => sum(y.series.total) - sum(x.series.total));
+
+  return {
+    config: {labels: c.labels, year: c.year, cutoff: c.cutoff},
+    cards,
+    ajada_removed_rows: c.ajada_removed_rows,
+  };
+}
+
+function localPage(payload, offset){
+  const end = Math.min(payload.cards.length, offset + PAGE_SIZE);
+  return {...payload, cards: payload.cards.slice(offset, end),
+          page: {offset, limit: PAGE_SIZE, total_cards: payload.cards.length, next_offset: end < payload.cards.length ? end : null}};
+}
+
+// ✅ format=columnar: الكروت تجي مصفوفات متوازية (أصغر وأسرع)، نرجعها لشكل الكروت العادي
+function fromColumnar(j){
+  if(j.format !== "columnar") return j;
+  const c = j.cards;
+  const cards = c.title.map((title, i) => ({
+    title, slug: c.slug[i], dim: c.dim[i], value: c.value[i],
+    series: {total: c.total[i], approved: c.approved[i]},
+  }));
+  return {...j, cards};
+}
+
+async function loadPage(filters, offset, seq){
+  let j;
+  if(localPayload){
+    j = localPage(localPayload, offset);
+  }else{
+    const qs = toQuery({...filters, offset, limit: PAGE_SIZE, format: "columnar"}).toString();
+    j = fromColumnar(await fetchJSON(`/data?${qs}`, "/data"));
   }
-  renderCards(j);
+  if(seq !== loadSeq) return;  // المستخدم غيّر الفلتر
+  renderCards(j, offset > 0);
+  watchNextPage(filters, j.page?.next_offset, seq);
+}
+
+async function loadData(){
+  const seq = ++loadSeq;
+  const filters = currentSelection();
+  const changed = JSON.stringify(filters) !== JSON.stringify(currentFilters) || (LIVE && !eventSource);
+  currentFilters = filters;
+  localPayload = cube ? cubeBuildData(cube, filters) : null;
+  await loadPage(currentFilters, 0, seq);
+  if(changed) subscribeEvents(currentFilters);
 }
 
+function exportRows(format){
+  window.location.href = `/export?${toQuery({...currentSelection(), format}).toString()}`;
+}
+document.getElementById("btnCsv").addEventListener("click", () => exportRows("csv"));
+document.getElementById("btnXlsx").addEventListener("click", () => exportRows("xlsx"));
+
 document.getElementById("btnApply").addEventListener("click", async ()=> {
   try { await loadData(); }
   catch(e){
@@ -506,8 +1354,9 @@ document.getElementById("btnApply").addEventListener("click", async ()=> {
 
 (async function init(){
   try{
-    await loadOptions();
+    await loadCube();
     await loadData();
+    if(!cube) loadCube();  // وقت التحميل (503) نجيبه بعد ما تجهز البيانات
   }catch(e){
     console.error(e);
     const rows = document.getElementById("rows");
@@ -520,614 +1369,1773 @@ document.getElementById("btnApply").addEventListener("click", async ()=> {
 </html>
 """
 
-
 # =========================
-# Routes
+# Static assets (مضغوطة مسبقاً + روابط فيها hash)
 # =========================
-_df_cache = None
+STATIC_DIR = os.path.join(os.path.dirname(__file__), "static")
+ASSET_CACHE_CONTROL = "public, max-age=31536000, immutable"
+COMPRESS_MIN_BYTES = 1024
+
+_MIMETYPES = {
+    ".js": "application/javascript; charset=utf-8",
+    ".css": "text/css; charset=utf-8",
+    ".woff2": "font/woff2",
+    ".svg": "image/svg+xml",
+}
 
-@app.route("/")
-def index():
-    return Response(HTML, mimetype="text/html; charset=utf-8")
+ASSET_URLS: Dict[str, str] = {}  # vendor/chart.umd.min.js -> /assets/vendor/chart.umd.min.<hash>.js
+_assets: Dict[str, Dict[str, Any]] = {}
+_page: Dict[str, Any] = {}
+
+_assets_lock = threading.Lock()
+
+def _make_asset(body: bytes, mimetype: str) -> Dict[str, Any]:
+    # النسخ المضغوطة تنبني عند أول طلب يبغاها (مو وقت import) عشان الإقلاع يكون سريع
+    encodings = ("br", "gzip") if brotli is not None else ("gzip",)
+    return {"variants": {"identity": body}, "pending": set(encodings),
+            "etag": hashlib.sha1(body).hexdigest()[:16], "mimetype": mimetype}
+
+def _asset_variants(asset: Dict[str, Any]) -> Dict[str, bytes]:
+    if asset["pending"]:
+        with _assets_lock:
+            body = asset["variants"]["identity"]
+            for enc in list(asset["pending"]):
+                packed = brotli.compress(body, quality=9) if enc == "br" else gzip.compress(body, 9)
+                if len(packed) < len(body):
+                    asset["variants"][enc] = packed
+                asset["pending"].discard(enc)
+    return asset["variants"]
+
+def build_assets() -> None:
+    """
+    مرة وحدة وقت التشغيل: نقرأ static/ ونجهز نسخ gzip/br، ونركّب روابط الصفحة
+    """
+    global _page
+    if os.path.isdir(STATIC_DIR):
+        for root, _dirs, files in os.walk(STATIC_DIR):
+            for fn in files:
+                base, ext = os.path.splitext(fn)
+                if ext not in _MIMETYPES:
+                    continue
+                path = os.path.join(root, fn)
+                with open(path, "rb") as f:
+                    body = f.read()
+                asset = _make_asset(body, _MIMETYPES[ext])
+                rel = os.path.relpath(path, STATIC_DIR).replace(os.sep, "/")
+                hashed = f"{rel[: -len(fn)]}{base}.{asset['etag'][:10]}{ext}"
+                _assets[hashed] = asset
+                ASSET_URLS[rel] = f"/assets/{hashed}"
+
+    page = HTML.replace("{{CHART_JS_URL}}", ASSET_URLS.get("vendor/chart.umd.min.js", ""))
+    _page = _make_asset(page.encode("utf-8"), "text/html; charset=utf-8")
+
+def _accepted_encoding(available) -> str:
+    for enc in ("br", "gzip"):
+        if enc in available and request.accept_encodings[enc] > 0:
+            return enc
+    return "identity"
+
+def _asset_response(asset: Dict[str, Any], cache_control: str):
+    variants = _asset_variants(asset)
+    enc = _accepted_encoding(variants)
+    etag = asset["etag"] if enc == "identity" else f"{asset['etag']}-{enc}"
+
+    if request.if_none_match.contains(etag):
+        resp = Response(status=304)
+    else:
+        resp = Response(variants[enc], mimetype=asset["mimetype"])
+        if enc != "identity":
+            resp.headers["Content-Encoding"] = enc
+    resp.set_etag(etag)
+    resp.headers["Cache-Control"] = cache_control
+    resp.vary.add("Accept-Encoding")
+    return resp
 
+build_assets()
 
-@app.route("/options")
-def options():
-    try:
-        global _df_cache
-        if _df_cache is None:
-            _df_cache = prepare_df()
-        return jsonify(build_options(_df_cache))
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
 
+# =========================
+# تحميل البيانات في الخلفية (warm-up)
+# =========================
+_df_cache: Optional[pd.DataFrame] = None
+_raw_cache: Optional[pd.DataFrame] = None  # كل أعمدة الإكسل لنفس صفوف _df_cache (للتصدير)
+_rows_index: Optional[Dict[str, np.ndarray]] = None  # ترتيب الصفوف حسب (_dt, id) لـ /rows
+_search_index: Optional[Dict[str, Any]] = None  # فهرس مقلوب للبحث النصي
+_suggest_index: Optional[Dict[str, Dict[str, Any]]] = None  # مصفوفات مرتبة لاقتراحات الفلاتر
+_cooc_index: Optional[Dict[str, Any]] = None  # تجميع (بلدية، إدارة، نوع) → عدد، للفلاتر المتتالية
+_cube_cache: Optional[Dict[str, Any]] = None  # مكعّب (بلدية، إدارة، نوع، ربع، مقبول) → عدد، للمتصفح (JSON + gzip/br جاهزة)
+_rankings_cache: Optional[Dict[str, Any]] = None  # ترتيب القيم لكل (بُعد، ربع، مقياس)
+_query_store: Optional[Dict[str, Any]] = None  # أعمدة أكواد لكل بُعد (بلدية/إدارة/نوع/حالة/ربع) لـ /query
+_load_lock = threading.Lock()
+_warmup_thread: Optional[threading.Thread] = None
+_load_state: Dict[str, Any] = {
+    "status": "idle",  # idle | loading | ready | error
+    "stage": "",
+    "progress": 0,
+    "error": None,
+    "started_at": None,
+    "version": None,
+    "rows": 0,
+    "ajada_removed_rows": 0,
+    "load_seconds": None,
+    "loaded_at": None,
+}
 
-@app.route("/data")
-def data():
-    try:
-        global _df_cache
-        if _df_cache is None:
-            _df_cache = prepare_df()
+def dataset_version() -> str:
+    st = os.stat(EXCEL_PATH)
+    raw = f"{EXCEL_PATH}|{st.st_size}|{st.st_mtime_ns}"
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:12]
+
+def _set_stage(stage: str, progress: int) -> None:
+    with _load_lock:
+        _load_state["stage"] = stage
+        _load_state["progress"] = progress
 
-        muni = request.args.get("muni", "ALL")
-        dept = request.args.get("dept", "ALL")
-        type_ = request.args.get("type", "ALL")
+def load_dataset() -> pd.DataFrame:
+    """
+    قراءة + حذف إجادة + تجهيز، مع تحديث حالة التحميل (المرحلة والنسبة)
+    """
+    global _df_cache, _raw_cache, _rows_index, _search_index, _suggest_index, _cooc_index, _cube_cache, _rankings_cache
+    global _query_store
+    t0 = time.time()
+    with _load_lock:
+        _load_state.update(status="loading", stage="", progress=0, error=None, started_at=t0)
 
-        return jsonify(build_data(_df_cache, muni, dept, type_))
+    try:
+        _set_stage("read_excel", 5)
+        df_full = load_excel_full()
+        version = dataset_version()
+
+        _set_stage("exclude_ajada", 60)
+        df_full = exclude_ajada_everywhere(df_full)
+
+        _set_stage("prepare", 85)
+        df = prepare_df(df_full)
+        raw = df_full.loc[df.index]
+        rows_index = build_rows_index(df)
+
+        _set_stage("search_index", 93)
+        search_index = build_search_index(raw)
+        suggest_index = build_suggest_index(df)
+        cooc_index = build_cooccurrence(df)
+        cube = cube_asset(build_cube(df, version), version)
+        rankings = build_rankings(df)
+        query_store = build_query_store(df)
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        with _load_lock:
+            _load_state.update(status="error", stage="", progress=0, error=str(e))
+        inc("yazan_dataset_loads_total", {"result": "error"})
+        raise
+
+    load_seconds = time.time() - t0
+    with _load_lock:
+        _df_cache = df
+        _raw_cache = raw
+        _rows_index = rows_index
+        _search_index = search_index
+        _suggest_index = suggest_index
+        _cooc_index = cooc_index
+        _cube_cache = cube
+        _rankings_cache = rankings
+        _query_store = query_store
+        _cards_cache.clear()
+        _query_plans.clear()
+        _rows_cache.clear()
+        _load_state.update(
+            status="ready",
+            stage="",
+            progress=100,
+            version=version,
+            rows=int(len(df)),
+            ajada_removed_rows=int(df.attrs.get("ajada_removed_rows", 0)),
+            load_seconds=round(load_seconds, 3),
+            loaded_at=time.time(),
+        )
 
+    inc("yazan_dataset_loads_total", {"result": "ok"})
+    observe("yazan_dataset_load_seconds", load_seconds)
+    set_gauge("yazan_dataset_rows", len(df))
+    set_gauge("yazan_dataset_ajada_removed_rows", int(df.attrs.get("ajada_removed_rows", 0)))
+    publish_version(version)
+    return df
 
-if __name__ == "__main__":
-    print("RUNNING → http://127.0.0.1:5000")
-    app.run(debug=True)
-from __future__ import annotations
+def run_cpu_bound(fn, *args):
+    """
+    تحت gevent: fn تشتغل في thread نظام (threadpool الـ hub) والـ greenlet بس ينتظر النتيجة،
+    وإلا تحميل الإكسل يوقف الـ event loop كله (حتى /healthz و/events) لين يخلص
+    """
+    if not GEVENT_PATCHED:
+        return fn(*args)
+    import gevent
+    return gevent.get_hub().threadpool.apply(fn, args)
 
-import os
-from datetime import datetime, date
-from typing import List, Optional, Dict, Any
-import re
+def _warmup() -> None:
+    try:
+        run_cpu_bound(load_dataset)
+    except Exception as e:
+        print(f"WARMUP FAILED: {e}")
 
-import pandas as pd
-from flask import Flask, jsonify, Response, request
+def ensure_warmup() -> None:
+    """
+    يشغّل التحميل في thread لو البيانات مو جاهزة ولا فيه تحميل شغال
+    (بعد fork في gunicorn الـ thread القديم ما يكون حي، فنبدأ واحد جديد)
+    """
+    global _warmup_thread
+    with _load_lock:
+        if _df_cache is not None:
+            return
+        if _warmup_thread is not None and _warmup_thread.is_alive():
+            return
+        _warmup_thread = threading.Thread(target=_warmup, name="dataset-warmup", daemon=True)
+        _warmup_thread.start()
+
+def dataset_status() -> Dict[str, Any]:
+    with _load_lock:
+        st = dict(_load_state)
+    now = time.time()
+    st["age_seconds"] = round(now - st["loaded_at"], 1) if st["loaded_at"] else None
+    st["elapsed_seconds"] = round(now - st["started_at"], 1) if st["status"] == "loading" and st["started_at"] else None
+    if st["loaded_at"]:
+        st["loaded_at"] = datetime.fromtimestamp(st["loaded_at"]).isoformat(timespec="seconds")
+    st.pop("started_at", None)
+    return st
+
+def _cached_df() -> Tuple[Optional[pd.DataFrame], Optional[str]]:
+    with _load_lock:
+        df, version = _df_cache, _load_state["version"]
+    inc("yazan_cache_requests_total", {"cache": "dataset", "result": "miss" if df is None else "hit"})
+    return df, version
+
+def _not_ready_response():
+    """
+    البيانات مو جاهزة: 503 سريع مع Retry-After ونسبة التحميل،
+    أو 500 لو آخر محاولة تحميل فشلت (ونعيد المحاولة في الخلفية)
+    """
+    st = dataset_status()
+    ensure_warmup()
+    if st["status"] == "error":
+        return jsonify({"error": st["error"], "loading": False}), 500
+
+    resp = jsonify({
+        "error": "البيانات قيد التحميل، حاول بعد لحظات",
+        "loading": True,
+        "stage": st["stage"],
+        "progress": st["progress"],
+        "elapsed_seconds": st["elapsed_seconds"],
+    })
+    resp.status_code = 503
+    resp.headers["Retry-After"] = str(RETRY_AFTER_SEC)
+    return resp
 
-app = Flask(__name__)
 
 # =========================
-# الإعدادات
+# كاش نتائج build_data (الكروت مرتبة مرة وحدة لكل فلتر)
 # =========================
-# ✅ لازم يكون ملف الإكسل داخل نفس فولدر المشروع (نفس فولدر app.py)
-# وسمّيه: تقرير_الاعتراضات.xlsx
-EXCEL_PATH = os.path.join(os.path.dirname(__file__), "تقرير_الاعتراضات.xlsx")
+_cards_cache: "OrderedDict[tuple, Dict[str, Any]]" = OrderedDict()
+_cards_lock = threading.Lock()
 
-CUTOFF_ISO = "2025-12-13"
-YEAR_OVERRIDE: Optional[int] = None
+_cards_inflight: Dict[tuple, "_Flight"] = {}
 
-COL_DATE   = "تاريخ تقديم الاعتراض"
-COL_TYPE   = "نوع الرقابة"
-COL_DEPT   = "اسم الادارة"
-COL_STATUS = "حالة الاعتراض"
-COL_MUNI   = "اسم البلدية"
+class _Flight:
+    """
+    حساب شغّال لمفتاح معيّن: الطلبات المطابقة تنتظره بدل ما تعيد نفس الحساب
+    """
+    __slots__ = ("done", "result", "error")
 
-APPROVED_STATUS_VALUE = "مكتمل - مقبول"
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error: Optional[BaseException] = None
 
-# ❌ استبعاد إجادة نهائيًا (بكل أشكالها)
-AJADA_KEYWORDS = [
-    "إجادة",
-    "اجادة",
-    "إجاده",
-    "اجاده",
-]
+def filter_key(value: FilterValue) -> Union[str, Tuple[str, ...]]:
+    """
+    مفتاح مطبّع للفلتر: "بلدية الأحساء" و"بلديه الاحساء" نفس المفتاح، وترتيب القيم ما يفرق
+    """
+    values = filter_values(value)
+    if values is None:
+        return "ALL"
+    norms = sorted({_norm(v) for v in values})
+    return norms[0] if len(norms) == 1 else tuple(norms)
 
-TOP_TYPES_LIMIT = 50  # لو تبين كل الأنواع خليها 999
+def profiling_forced() -> bool:
+    """
+    profile=1: نتجاوز الكاش والـ coalescing عشان التقرير يقيس الحساب الفعلي مو cache hit
+    """
+    return has_request_context() and g.get("profiling", False)
+
+def with_request_names(payload: Dict[str, Any], muni: FilterValue, dept: FilterValue, type_: FilterValue) -> Dict[str, Any]:
+    """
+    الكاش مشترك بالمفتاح المطبّع، فالنتيجة فيها كتابة أول واحد طلب الفلتر؛ هنا نرجّع config
+    وعناوين كروت القيم المختارة بكتابة الطلب الحالي (نفس الحساب المحلي من /cube في الصفحة)
+    """
+    requested = {"muni": muni, "dept": dept, "type": type_}
+    spelled = {
+        dim: {_norm(v): v for v in reversed(filter_values(value) or [])}  # أول قيمة بنفس التطبيع تغلب
+        for dim, value in requested.items()
+    }
+    cards = []
+    for card in payload["cards"]:
+        name = spelled.get(card["dim"], {}).get(_norm(card["value"])) if card["value"] is not None else None
+        if name is not None and name != card["title"]:
+            card = {**card, "title": name, "slug": safe_slug(name), "value": name}
+        cards.append(card)
+
+    config = payload["config"]
+    if all(config[dim] == value for dim, value in requested.items()) and all(a is b for a, b in zip(cards, payload["cards"])):
+        return payload
+    out = dict(payload)
+    out["config"] = {**config, **requested}
+    out["cards"] = cards
+    return out
+
+def cached_build_data(df: pd.DataFrame, version: Optional[str],
+                      muni: FilterValue, dept: FilterValue, type_: FilterValue) -> Dict[str, Any]:
+    if profiling_forced():
+        return build_data(df, muni, dept, type_)
+    return with_request_names(_cached_build_data(df, version, muni, dept, type_), muni, dept, type_)
+
+def _cached_build_data(df: pd.DataFrame, version: Optional[str],
+                       muni: FilterValue, dept: FilterValue, type_: FilterValue) -> Dict[str, Any]:
+    key = (version, filter_key(muni), filter_key(dept), filter_key(type_))
+    with _cards_lock:
+        hit = _cards_cache.get(key)
+        if hit is not None:
+            _cards_cache.move_to_end(key)
+        else:
+            flight = _cards_inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = _cards_inflight[key] = _Flight()
+    inc("yazan_cache_requests_total", {"cache": "cards", "result": "miss" if hit is None else "hit"})
+    if hit is not None:
+        return hit
+
+    # ✅ coalescing: أول طلب يحسب، والطلبات المتزامنة بنفس المفتاح تاخذ نفس النتيجة
+    if not leader:
+        inc("yazan_coalesced_requests_total", {"cache": "cards"})
+        with stage_timer("build_data.coalesced_wait"):
+            flight.done.wait()
+        if flight.error is not None:
+            raise flight.error
+        return flight.result
+
+    try:
+        flight.result = build_data(df, muni, dept, type_)
+    except Exception as e:
+        flight.error = e
+        raise
+    finally:
+        with _cards_lock:
+            if flight.error is None:
+                _cards_cache[key] = flight.result
+                while len(_cards_cache) > CARDS_CACHE_SIZE:
+                    _cards_cache.popitem(last=False)
+            _cards_inflight.pop(key, None)
+        flight.done.set()
+    return flight.result
+
+def page_cards(payload: Dict[str, Any], offset: int, limit: Optional[int]) -> Dict[str, Any]:
+    cards = payload["cards"]
+    total = len(cards)
+    end = total if limit is None else min(total, offset + limit)
+    out = dict(payload)
+    out["cards"] = cards[offset:end]
+    out["page"] = {
+        "offset": offset,
+        "limit": limit,
+        "total_cards": total,
+        "next_offset": end if end < total else None,
+    }
+    return out
 
 
 # =========================
-# Helpers
+# تصدير الصفوف (CSV / XLSX) بشكل streaming
 # =========================
-def _norm(s) -> str:
-    if pd.isna(s):
-        return ""
-    return (
-        str(s).strip()
-        .replace("أ", "ا")
-        .replace("إ", "ا")
-        .replace("آ", "ا")
-        .replace("ى", "ي")
-        .replace("ة", "ه")
-        .lower()
-    )
-
-def quarter_of(ts: pd.Timestamp) -> int:
-    return (ts.month - 1) // 3 + 1
+def _xlsx_cell(v):
+    if v is None or (not isinstance(v, str) and pd.isna(v)):
+        return None
+    if isinstance(v, pd.Timestamp):
+        return v.to_pydatetime()
+    if hasattr(v, "item"):  # numpy scalars
+        return v.item()
+    return v
+
+def iter_export_csv(raw: pd.DataFrame, index: pd.Index):
+    """
+    CSV مع BOM (عشان Excel يقرأ العربي صح)، كل دفعة EXPORT_CHUNK_ROWS صف، وكل الأسطر \r\n
+    """
+    yield ("\ufeff" + raw.iloc[:0].to_csv(index=False, lineterminator="\r\n")).encode("utf-8")
+    for i in range(0, len(index), EXPORT_CHUNK_ROWS):
+        chunk = raw.loc[index[i:i + EXPORT_CHUNK_ROWS]]
+        yield chunk.to_csv(header=False, index=False, lineterminator="\r\n").encode("utf-8")
 
-def quarter_labels_up_to(cutoff: date, year: int) -> List[str]:
-    q = (cutoff.month - 1) // 3 + 1
-    return [f"{year}-Q{i}" for i in range(1, q + 1)]
+def iter_export_xlsx(raw: pd.DataFrame, index: pd.Index):
+    """
+    openpyxl write_only يكتب الصفوف على ملف مؤقت، وبعدين نرسل الملف على دفعات.
+    ملاحظة: أول بايت يطلع بعد ما ينكتب الملف كله، عشان كذا الصفوف محدودة بـ EXPORT_XLSX_MAX_ROWS
+    """
+    from openpyxl import Workbook
 
-def safe_slug(s: str) -> str:
-    return re.sub(r"[^a-z0-9\u0600-\u06FF]+", "-", _norm(s)).strip("-") or "x"
+    fd, path = tempfile.mkstemp(suffix=".xlsx")
+    os.close(fd)
+    try:
+        wb = Workbook(write_only=True)
+        ws = wb.create_sheet("الاعتراضات")
+        ws.append(list(raw.columns))
+        for i in range(0, len(index), EXPORT_CHUNK_ROWS):
+            chunk = raw.loc[index[i:i + EXPORT_CHUNK_ROWS]]
+            for row in chunk.itertuples(index=False, name=None):
+                ws.append([_xlsx_cell(v) for v in row])
+        wb.save(path)
+        with open(path, "rb") as f:
+            while True:
+                block = f.read(64 * 1024)
+                if not block:
+                    break
+                yield block
+    finally:
+        os.remove(path)
 
 
 # =========================
-# قراءة البيانات + حذف إجادة
+# /rows: صفوف الاعتراضات بصفحات keyset (آخر تاريخ + id)
 # =========================
-def load_excel_full() -> pd.DataFrame:
-    if not os.path.exists(EXCEL_PATH):
-        raise FileNotFoundError(
-            f"ملف الإكسل غير موجود: {EXCEL_PATH}\n"
-            "تأكدي أنك وضعتي ملف (تقرير_الاعتراضات.xlsx) داخل نفس مجلد app.py ورفعتيه مع المشروع."
-        )
-
-    df = pd.read_excel(EXCEL_PATH, engine="openpyxl")
-    df.columns = df.columns.astype(str).str.strip()
-    return df
+_rows_cache: "OrderedDict[tuple, Optional[np.ndarray]]" = OrderedDict()
+_rows_lock = threading.Lock()
 
-def exclude_ajada_everywhere(df: pd.DataFrame) -> pd.DataFrame:
+def build_rows_index(df: pd.DataFrame) -> Dict[str, np.ndarray]:
     """
-    حذف أي صف يحتوي كلمة إجادة (بكل أشكالها) في أي عمود
+    ترتيب ثابت لكل الصفوف حسب (_dt, id): order = مواقع الصفوف بالترتيب، rank = عكسه
     """
-    keys = [_norm(k) for k in AJADA_KEYWORDS]
-    sn = df.fillna("").astype(str).applymap(_norm)
+    dt = df["_dt"].to_numpy(dtype="datetime64[ns]").astype(np.int64)
+    ids = df.index.to_numpy(dtype=np.int64)
+    order = np.lexsort((ids, dt)).astype(np.int32)
+    rank = np.empty(len(order), dtype=np.int32)
+    rank[order] = np.arange(len(order), dtype=np.int32)
+    return {"order": order, "rank": rank, "dt": dt[order], "id": ids[order]}
+
+def encode_cursor(dt_ns: int, row_id: int) -> str:
+    return base64.urlsafe_b64encode(f"{dt_ns}:{row_id}".encode("ascii")).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple[int, int]:
+    raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode("ascii")
+    dt_ns, row_id = raw.split(":")
+    return int(dt_ns), int(row_id)
+
+def _matching_ranks(df: pd.DataFrame, idx: Dict[str, np.ndarray], key: tuple) -> Optional[np.ndarray]:
+    """
+    مواقع الصفوف المطابقة داخل الترتيب العام (مرتبة)، مع كاش لكل فلتر
+    """
+    if profiling_forced():
+        mask = filter_mask(df, *(list(k) if isinstance(k, tuple) else k for k in key[1:]))
+        return None if mask is None else np.sort(idx["rank"][mask])
+    with _rows_lock:
+        if key in _rows_cache:
+            _rows_cache.move_to_end(key)
+            inc("yazan_cache_requests_total", {"cache": "rows", "result": "hit"})
+            return _rows_cache[key]
+    inc("yazan_cache_requests_total", {"cache": "rows", "result": "miss"})
+
+    mask = filter_mask(df, *(list(k) if isinstance(k, tuple) else k for k in key[1:]))
+    ranks = None if mask is None else np.sort(idx["rank"][mask])
+    with _rows_lock:
+        _rows_cache[key] = ranks
+        while len(_rows_cache) > ROWS_CACHE_SIZE:
+            _rows_cache.popitem(last=False)
+    return ranks
+
+def _json_cell(v):
+    if v is None or (not isinstance(v, str) and pd.isna(v)):
+        return None
+    if isinstance(v, (pd.Timestamp, datetime, date)):
+        return v.isoformat()
+    if hasattr(v, "item"):
+        return v.item()
+    return v
+
+@timed("build_rows")
+def build_rows(df: pd.DataFrame, raw: pd.DataFrame, idx: Dict[str, np.ndarray], version: Optional[str],
+               muni: FilterValue, dept: FilterValue, type_: FilterValue, quarter: str,
+               cursor: Optional[str], limit: int, columns: List[str]) -> Dict[str, Any]:
+    ranks = _matching_ranks(df, idx, (version, filter_key(muni), filter_key(dept), filter_key(type_), quarter))
+    total = len(idx["order"]) if ranks is None else len(ranks)
+
+    # أول موقع بعد الـ cursor في الترتيب العام (حتى لو الصف نفسه انحذف بعد إعادة التحميل)
+    start_rank = 0
+    if cursor:
+        dt_ns, row_id = decode_cursor(cursor)
+        lo = int(np.searchsorted(idx["dt"], dt_ns, side="left"))
+        hi = int(np.searchsorted(idx["dt"], dt_ns, side="right"))
+        start_rank = lo + int(np.searchsorted(idx["id"][lo:hi], row_id, side="right"))
+
+    if ranks is None:
+        page = np.arange(start_rank, min(total, start_rank + limit))
+        has_more = start_rank + limit < total
+    else:
+        s = int(np.searchsorted(ranks, start_rank, side="left"))
+        page = ranks[s:s + limit]
+        has_more = s + limit < total
 
-    mask = False
-    for k in keys:
-        mask = mask | sn.apply(lambda col: col.str.contains(k, na=False), axis=0).any(axis=1)
+    positions = idx["order"][page]
+    records = raw.iloc[positions][columns]
+    rows = [
+        {"id": int(rid), **{c: _json_cell(v) for c, v in zip(columns, vals)}}
+        for rid, vals in zip(idx["id"][page], records.itertuples(index=False, name=None))
+    ]
 
-    removed = int(mask.sum())
-    out = df.loc[~mask].copy()
-    out.attrs["ajada_removed_rows"] = removed
-    return out
-
-def prepare_df() -> pd.DataFrame:
-    cutoff_dt = datetime.strptime(CUTOFF_ISO, "%Y-%m-%d").date()
-    year = YEAR_OVERRIDE or cutoff_dt.year
-
-    df_full = load_excel_full()
-    df_full = exclude_ajada_everywhere(df_full)  # ✅ حذف إجادة قبل أي شيء
-
-    needed = [COL_DATE, COL_TYPE, COL_DEPT, COL_STATUS, COL_MUNI]
-    missing = [c for c in needed if c not in df_full.columns]
-    if missing:
-        raise ValueError(f"أعمدة ناقصة: {missing}")
-
-    df = df_full[needed].copy()
-
-    df["_dt"] = pd.to_datetime(df[COL_DATE], errors="coerce")
-    df = df.dropna(subset=["_dt"])
-
-    start = pd.Timestamp(year=year, month=1, day=1)
-    end = pd.Timestamp(cutoff_dt)
-    df = df[(df["_dt"] >= start) & (df["_dt"] <= end)]
-
-    df["_yq"] = df["_dt"].apply(lambda x: f"{year}-Q{quarter_of(x)}")
-
-    df["_muni_norm"] = df[COL_MUNI].map(_norm)
-    df["_dept_norm"] = df[COL_DEPT].map(_norm)
-    df["_type_norm"] = df[COL_TYPE].map(_norm)
-
-    df["_approved"] = df[COL_STATUS].astype(str).str.strip().eq(APPROVED_STATUS_VALUE)
-
-    df.attrs["ajada_removed_rows"] = int(df_full.attrs.get("ajada_removed_rows", 0))
-    return df
+    next_cursor = None
+    if has_more and len(page):
+        last = int(page[-1])
+        next_cursor = encode_cursor(int(idx["dt"][last]), int(idx["id"][last]))
+    return {"rows": rows, "columns": columns, "total": total, "limit": limit, "next_cursor": next_cursor}
 
 
 # =========================
-# API
+# البحث النصي (inverted index)
 # =========================
-def build_options(df: pd.DataFrame) -> Dict[str, List[str]]:
-    munis = sorted({str(x).strip() for x in df[COL_MUNI].dropna().unique() if str(x).strip()})
-    depts = sorted({str(x).strip() for x in df[COL_DEPT].dropna().unique() if str(x).strip()})
-    types = sorted({str(x).strip() for x in df[COL_TYPE].dropna().unique() if str(x).strip()})
-    return {"municipalities": munis, "departments": depts, "types": types}
-
-def build_series(g: pd.DataFrame, labels: List[str]) -> Dict[str, List[int]]:
-    base = {l: 0 for l in labels}
-    total_map = g.groupby("_yq").size().to_dict()
-    approved_map = g[g["_approved"]].groupby("_yq").size().to_dict()
-
-    total = base.copy()
-    approved = base.copy()
-
-    for k, v in total_map.items():
-        if k in total:
-            total[k] = int(v)
-    for k, v in approved_map.items():
-        if k in approved:
-            approved[k] = int(v)
-
-    return {"total": [total[l] for l in labels], "approved": [approved[l] for l in labels]}
-
-def build_data(df: pd.DataFrame, muni: str, dept: str, type_: str) -> Dict[str, Any]:
-    cutoff_dt = datetime.strptime(CUTOFF_ISO, "%Y-%m-%d").date()
-    year = YEAR_OVERRIDE or cutoff_dt.year
-    labels = quarter_labels_up_to(cutoff_dt, year)
-
-    sub = df
-    if muni != "ALL":
-        sub = sub[sub["_muni_norm"] == _norm(muni)]
-    if dept != "ALL":
-        sub = sub[sub["_dept_norm"] == _norm(dept)]
-    if type_ != "ALL":
-        sub = sub[sub["_type_norm"] == _norm(type_)]
-
-    if sub.empty:
-        return {
-            "config": {"labels": labels, "year": year, "cutoff": CUTOFF_ISO, "muni": muni, "dept": dept, "type": type_},
-            "cards": [],
-            "ajada_removed_rows": int(df.attrs.get("ajada_removed_rows", 0))
-        }
-
-    cards: List[Dict[str, Any]] = []
-
-    if type_ == "ALL":
-        counts = sub.groupby(COL_TYPE).size().sort_values(ascending=False)
-        top = list(counts.head(TOP_TYPES_LIMIT).index.astype(str))
-
-        sub2 = sub.copy()
-        sub2["_bucket"] = sub2[COL_TYPE].astype(str).apply(lambda x: x if x in top else "نوع رقابه غير محدد")
-
-        for name, g in sub2.groupby("_bucket"):
-            cards.append({"title": str(name), "slug": safe_slug(str(name)), "series": build_series(g, labels)})
-
-        cards.sort(key=lambda c: sum(c["series"]["total"]), reverse=True)
+@timed("build_search_index")
+def build_search_index(raw: pd.DataFrame) -> Dict[str, Any]:
+    """
+    vocab مرتب + postings بصيغة CSR (مصفوفة int32 وحدة + offsets لكل كلمة)
+    كل قيمة مختلفة في العمود تتقطع مرة وحدة بس، وبعدين نوزعها على الصفوف vectorized
+    """
+    n = len(raw)
+    cols = SEARCH_COLUMNS or [c for c in raw.columns if c != COL_DATE and raw[c].dtype == object]
+    cols = [c for c in cols if c in raw.columns]
+
+    vocab: Dict[str, int] = {}
+    row_parts: List[np.ndarray] = []
+    tok_parts: List[np.ndarray] = []
+    for col in cols:
+        codes, uniques = pd.factorize(raw[col])
+        toks = [[vocab.setdefault(t, len(vocab)) for t in set(tokenize(u))] for u in uniques]
+        lens = np.fromiter((len(t) for t in toks), dtype=np.int64, count=len(toks))
+        flat = np.fromiter(itertools.chain.from_iterable(toks), dtype=np.int64, count=int(lens.sum()))
+        starts = np.cumsum(lens) - lens
+
+        rows = np.flatnonzero(codes >= 0)
+        rl = lens[codes[rows]]
+        total = int(rl.sum())
+        if total == 0:
+            continue
+        seg_start = np.cumsum(rl) - rl
+        row_parts.append(np.repeat(rows.astype(np.int32), rl))
+        tok_parts.append(flat[np.repeat(starts[codes[rows]] - seg_start, rl) + np.arange(total)])
+
+    terms = sorted(vocab)
+    if not tok_parts:
+        return {"terms": terms, "offsets": np.zeros(len(terms) + 1, dtype=np.int64), "postings": np.zeros(0, dtype=np.int32), "columns": cols, "n": n}
+
+    remap = np.empty(len(vocab), dtype=np.int64)
+    remap[[vocab[t] for t in terms]] = np.arange(len(terms))
+
+    # (كلمة، صف) فريدة ومرتبة = postings لكل كلمة مرتبة تصاعدياً
+    # (sort + مقارنة الجيران بدل np.unique: نفس النتيجة وأسرع بكثير على ملايين المفاتيح)
+    keys = remap[np.concatenate(tok_parts)] * max(n, 1) + np.concatenate(row_parts)
+    keys.sort()
+    keys = keys[np.r_[True, keys[1:] != keys[:-1]]]
+    term_ids = keys // max(n, 1)
+    postings = (keys % max(n, 1)).astype(np.int32)
+    offsets = np.searchsorted(term_ids, np.arange(len(terms) + 1))
+    return {"terms": terms, "offsets": offsets, "postings": postings, "columns": cols, "n": n}
+
+def _term_postings(index: Dict[str, Any], term: str, prefix: bool) -> np.ndarray:
+    terms = index["terms"]
+    lo = bisect.bisect_left(terms, term)
+    if prefix:
+        hi = bisect.bisect_left(terms, term + "\U0010ffff")
     else:
-        cards.append({"title": type_, "slug": safe_slug(type_), "series": build_series(sub, labels)})
-
+        hi = lo + 1 if lo < len(terms) and terms[lo] == term else lo
+    if hi <= lo:
+        return np.zeros(0, dtype=np.int32)
+    block = index["postings"][index["offsets"][lo]:index["offsets"][hi]]
+    # كلمة وحدة = مرتبة أصلاً، prefix = اتحاد أكثر من كلمة: نعلّم الصفوف في mask بدل np.unique
+    if hi - lo == 1:
+        return block
+    mask = np.zeros(index["n"], dtype=bool)
+    mask[block] = True
+    return np.flatnonzero(mask).astype(np.int32)
+
+def parse_search_query(q: str) -> List[Tuple[str, bool]]:
+    """
+    "شركة البنا*" -> [("شركه", False), ("البنا", True)]  (كل الكلمات AND)
+    """
+    terms = []
+    for part in q.split():
+        prefix = part.endswith("*")
+        for tok in tokenize(part.rstrip("*")):
+            terms.append((tok, False))
+        if prefix and terms:
+            terms[-1] = (terms[-1][0], True)
+    return terms[:SEARCH_MAX_TERMS]
+
+@timed("search")
+def search(df: pd.DataFrame, index: Dict[str, Any], q: str,
+           muni: FilterValue, dept: FilterValue, type_: FilterValue) -> Dict[str, Any]:
+    year, labels = period()
+
+    terms = parse_search_query(q)
+    lists = sorted((_term_postings(index, t, p) for t, p in terms), key=len)
+    pos = lists[0] if lists else np.zeros(0, dtype=np.int32)
+    for other in lists[1:]:
+        if not len(pos):
+            break
+        pos = np.intersect1d(pos, other, assume_unique=True)
+
+    mask = filter_mask(df, muni, dept, type_)
+    if mask is not None:
+        pos = pos[mask[pos]]
+
+    sub = df.iloc[pos]
+    series = build_series(sub, labels)
     return {
         "config": {"labels": labels, "year": year, "cutoff": CUTOFF_ISO, "muni": muni, "dept": dept, "type": type_},
-        "cards": cards,
-        "ajada_removed_rows": int(df.attrs.get("ajada_removed_rows", 0))
+        "q": q,
+        "terms": [t + ("*" if p else "") for t, p in terms],
+        "total": int(len(pos)),
+        "approved": int(sub["_approved"].sum()),
+        "series": series,
     }
 
 
 # =========================
-# HTML UI
+# اقتراحات الفلاتر (sorted-array prefix index)
 # =========================
-HTML = r"""
-<!doctype html>
-<html lang="ar" dir="rtl">
-<head>
-  <meta charset="utf-8"/>
-  <meta name="viewport" content="width=device-width,initial-scale=1"/>
-  <title>لوحة الاعتراضات</title>
-  <script src="https://cdn.jsdelivr.net/npm/chart.js@4.4.1/dist/chart.umd.min.js"></script>
-  <link rel="preconnect" href="https://fonts.googleapis.com">
-  <link rel="preconnect" href="https://fonts.gstatic.com" crossorigin>
-  <link href="https://fonts.googleapis.com/css2?family=IBM+Plex+Sans+Arabic:wght@400;500;600;700&display=swap" rel="stylesheet">
-
-  <style>
-    :root{
-      --bg-primary:#1a1a1a;
-      --bg-card:#242424;
-      --text-primary:#f1f5f9;
-      --text-secondary:#94a3b8;
-      --text-muted:#64748b;
-      --border:rgba(148,163,184,.12);
-      --shadow:0 20px 40px rgba(0,0,0,.4);
-      --approved:rgba(0,123,105,.9);
-      --remaining:rgba(71,85,105,.3);
-
-      --select-bg: #1f2937;
-      --select-border: rgba(148,163,184,.25);
-      --option-bg: #111827;
-      --option-fg: #f1f5f9;
-    }
+@timed("build_suggest_index")
+def build_suggest_index(df: pd.DataFrame) -> Dict[str, Dict[str, Any]]:
+    """
+    لكل حقل: القيم مرتبة حسب عدد الصفوف (id أصغر = أكثر صفوف)،
+    ومفاتيح مطبّعة بـ _norm تبدأ من كل كلمة في القيمة ("بلديه الهفوف" و "الهفوف") مرتبة للـ bisect
+    """
+    out: Dict[str, Dict[str, Any]] = {}
+    for field, col in SUGGEST_FIELDS.items():
+        counts = df[col].dropna().astype(str).str.strip().value_counts()
+        counts = counts[counts.index != ""]
+        values = [str(v) for v in counts.index]
+
+        pairs = []
+        for i, v in enumerate(values):
+            words = tokenize(v)
+            for j in range(len(words)):
+                pairs.append((" ".join(words[j:]), i))
+        pairs.sort()
+
+        out[field] = {
+            "values": values,
+            "counts": [int(c) for c in counts.to_numpy()],
+            "keys": [k for k, _ in pairs],
+            "ids": [i for _, i in pairs],
+        }
+    return out
 
-    *{box-sizing:border-box;margin:0;padding:0}
-    body{
-      background:linear-gradient(135deg,var(--bg-primary) 0%, #2a2a2a 100%);
-      color:var(--text-primary);
-      font-family:'IBM Plex Sans Arabic',system-ui,-apple-system,sans-serif;
-      min-height:100vh;
-    }
+def suggest(index: Dict[str, Dict[str, Any]], field: str, q: str, limit: int,
+            cascade: Optional[Dict[str, int]] = None) -> List[Dict[str, Any]]:
+    """
+    cascade: عدد كل قيمة مع الفلاتر الحالية (من cascade_counts) — لو موجود نرتب به ونشيل القيم الفاضية
+    """
+    f = index[field]
+    qn = " ".join(tokenize(q))
+    if not qn:
+        ids = range(len(f["values"]))
+    else:
+        lo = bisect.bisect_left(f["keys"], qn)
+        hi = bisect.bisect_left(f["keys"], qn + "\U0010ffff")
+        ids = set(f["ids"][lo:hi])
 
-    header{
-      border-bottom:1px solid var(--border);
-      background:rgba(36,36,36,.8);
-      backdrop-filter: blur(20px) saturate(180%);
-      position:sticky; top:0; z-index:100;
-    }
+    if cascade is None:
+        ids = heapq.nsmallest(limit, ids)
+        return [{"value": f["values"][i], "count": f["counts"][i]} for i in ids]
 
-    .container{max-width:1100px;margin:0 auto;padding:24px}
-    .topbarInner{
-      display:flex; justify-content:space-between; align-items:flex-end; gap:16px;
-      padding-top:6px;
-    }
-    .titleMain{font-size:20px;font-weight:800}
-    .subTitle{color:var(--text-secondary);font-size:13px;margin-top:6px}
-    .filters{display:flex; gap:12px; flex-wrap:wrap; margin-top:14px; align-items:center;}
+    scored = ((cascade.get(f["values"][i], 0), -i) for i in ids)
+    best = heapq.nlargest(limit, (s for s in scored if s[0] > 0))
+    return [{"value": f["values"][-neg], "count": c} for c, neg in best]
 
-    .select{
-      appearance:none; -webkit-appearance:none; -moz-appearance:none;
-      background: var(--select-bg);
-      border: 1px solid var(--select-border);
-      color: var(--text-primary);
-      padding: 10px 40px 10px 12px;
-      border-radius: 12px;
-      min-width: 220px;
-      outline: none;
-      font-weight: 700;
 
-      background-image:
-        linear-gradient(45deg, transparent 50%, var(--text-secondary) 50%),
-        linear-gradient(135deg, var(--text-secondary) 50%, transparent 50%);
-      background-position:
-        calc(18px) calc(50% - 2px),
-        calc(12px) calc(50% - 2px);
-      background-size: 6px 6px, 6px 6px;
-      background-repeat: no-repeat;
-    }
-    .select option, .select optgroup{ background: var(--option-bg); color: var(--option-fg); }
+# =========================
+# الفلاتر المتتالية (co-occurrence)
+# =========================
+COOC_DIMS = {"muni": COL_MUNI, "dept": COL_DEPT, "type": COL_TYPE}
+OPTIONS_KEYS = {"muni": "municipalities", "dept": "departments", "type": "types"}
 
-    .btn{
-      background:rgba(0,123,105,.22);
-      border:1px solid rgba(0,123,105,.45);
-      color:var(--text-primary);
-      padding:10px 14px;
-      border-radius:12px;
-      cursor:pointer;
-      font-weight:800;
-    }
+@timed("build_cooccurrence")
+def build_cooccurrence(df: pd.DataFrame) -> Dict[str, Any]:
+    """
+    تجميع مرة وحدة وقت التحميل: كل تركيبة (بلدية، إدارة، نوع) موجودة وعدد صفوفها.
+    الاستعلام بعدين يمشي على التركيبات (آلاف) مو على الصفوف (ملايين)
+    """
+    keys = pd.DataFrame({
+        dim: df[col].where(df[col].notna(), "").astype(str).str.strip()
+        for dim, col in COOC_DIMS.items()
+    })
+    combos = keys.groupby(list(COOC_DIMS), sort=False).size().reset_index(name="n")
+
+    dims: Dict[str, Dict[str, Any]] = {}
+    for dim in COOC_DIMS:
+        codes, labels = pd.factorize(combos[dim])
+        labels = [str(x) for x in labels]
+        norm_codes, norms = pd.factorize(pd.Series([_norm(x) for x in labels], dtype=object))
+        dims[dim] = {
+            "codes": codes.astype(np.int32),
+            "labels": labels,
+            "label_norm": norm_codes.astype(np.int32),
+            "norm_ids": {str(v): i for i, v in enumerate(norms)},
+        }
+    return {"n": combos["n"].to_numpy(dtype=np.int64), "dims": dims}
+
+def _cooc_mask(co: Dict[str, Any], selections: Dict[str, FilterValue], skip: Optional[str] = None) -> Optional[np.ndarray]:
+    mask = None
+    for dim, value in selections.items():
+        values = filter_values(value)
+        if dim == skip or values is None:
+            continue
+        d = co["dims"][dim]
+        nids = [d["norm_ids"].get(_norm(v), -1) for v in values]
+        m = np.isin(d["label_norm"][d["codes"]], nids)
+        mask = m if mask is None else (mask & m)
+    return mask
+
+def cascade_counts(co: Dict[str, Any], dim: str, selections: Dict[str, FilterValue]) -> Dict[str, int]:
+    """
+    عدد كل قيمة في dim مع باقي الاختيارات (بدون اختيار dim نفسه عشان يقدر يغيّره)
+    """
+    d = co["dims"][dim]
+    mask = _cooc_mask(co, selections, skip=dim)
+    codes, n = (d["codes"], co["n"]) if mask is None else (d["codes"][mask], co["n"][mask])
+    counts = np.bincount(codes, weights=n, minlength=len(d["labels"]))
+    return {d["labels"][i]: int(counts[i]) for i in np.flatnonzero(counts) if d["labels"][i]}
+
+@timed("cascade_options")
+def cascade_options(co: Dict[str, Any], selections: Dict[str, FilterValue]) -> Dict[str, Any]:
+    out: Dict[str, Any] = {"counts": {}}
+    for dim, key in OPTIONS_KEYS.items():
+        counts = cascade_counts(co, dim, selections)
+        out[key] = sorted(counts)
+        out["counts"][key] = counts
+    mask = _cooc_mask(co, selections)
+    out["total"] = int(co["n"].sum() if mask is None else co["n"][mask].sum())
+    out["selected"] = selections
+    return out
 
-    .rows{display:flex;flex-direction:column;gap:18px;padding-top:18px}
-    .row{
-      display:grid; grid-template-columns: 1fr 300px;
-      gap:16px; align-items:stretch;
-      direction:ltr;
-    }
-    .row *{direction:rtl}
-    @media (max-width:980px){ .row{grid-template-columns:1fr} .container{padding:16px} }
 
-    .card{
-      background:var(--bg-card);
-      border:1px solid var(--border);
-      border-radius:20px;
-      box-shadow:var(--shadow);
-      padding:18px;
-      overflow:hidden;
-    }
-    .chartHead{display:flex;align-items:center;justify-content:space-between;margin-bottom:10px;gap:10px}
-    .title{font-size:16px;font-weight:900}
-    .canvasWrap{height:240px;margin-top:8px}
+# =========================
+# مكعّب التجميع للمتصفح (/cube): الفلترة والكروت تنحسب محلياً بدون رجوع للسيرفر
+# =========================
+def _b64_array(values: np.ndarray) -> Dict[str, str]:
+    """
+    مصفوفة أرقام → أصغر نوع unsigned يكفيها (little-endian) + base64، تنقرأ في JS كـ TypedArray
+    """
+    top = int(values.max()) if len(values) else 0
+    dtype = "uint8" if top < 2 ** 8 else "uint16" if top < 2 ** 16 else "uint32"
+    data = values.astype(np.dtype(dtype).newbyteorder("<")).tobytes()
+    return {"dtype": dtype, "data": base64.b64encode(data).decode("ascii")}
 
-    .kpi{display:flex;flex-direction:column;justify-content:center;height:100%;gap:10px;text-align:right;padding:10px}
-    .kpiTitle{font-size:13px;color:var(--text-secondary);font-weight:800}
-    .kpiValue{font-size:44px;font-weight:900;letter-spacing:-1px}
-    .kpiStats{display:flex;gap:10px;margin-top:6px}
-    .kpiStat{flex:1;padding:10px;background:rgba(71,85,105,.2);border-radius:12px;border:1px solid var(--border)}
-    .kpiStatLabel{font-size:11px;color:var(--text-muted);margin-bottom:4px}
-    .kpiStatValue{font-size:16px;font-weight:900}
-    .muted{color:var(--text-secondary);font-size:12px}
-  </style>
-</head>
+@timed("cube_asset")
+def cube_asset(cube: Dict[str, Any], version: str) -> Dict[str, Any]:
+    """
+    المكعّب ما يتغير لين النسخة الجاية: نسلسله ونضغطه مرة وحدة وقت التحميل بدل كل طلب
+    """
+    asset = _make_asset(dumps_json(cube), "application/json")
+    asset["etag"] = f"cube-{version}"
+    _asset_variants(asset)
+    return asset
 
-<body>
-<header>
-  <div class="container">
-    <div class="topbarInner">
-      <div>
-        <div class="titleMain">لوحة الاعتراضات</div>
-        <div class="subTitle" id="subtitle"></div>
-        <div class="filters">
-          <select id="selMuni" class="select"></select>
-          <select id="selDept" class="select"></select>
-          <select id="selType" class="select"></select>
-          <button class="btn" id="btnApply">تطبيق</button>
-        </div>
-      </div>
-      <div class="muted" id="ajadaInfo"></div>
-    </div>
-  </div>
-</header>
+@timed("build_cube")
+def build_cube(df: pd.DataFrame, version: str) -> Dict[str, Any]:
+    """
+    كل تركيبة (بلدية، إدارة، نوع، ربع، مقبول) موجودة وعدد صفوفها، كأعمدة أكواد + قواميس.
+    البلدية/الإدارة بالقيم المطبّعة (الفلترة عليها)، والنوع بالاسم الأصلي (عنوان الكرت) + تطبيعه
+    """
+    year, labels = period()
+
+    muni = df["_muni_norm"].cat
+    dept = df["_dept_norm"].cat
+    t_codes, t_uniques = pd.factorize(df[COL_TYPE])
+    t_labels = [str(x) for x in t_uniques]
+    t_norms = [_norm(x) for x in t_uniques]
+    type_null = None
+    if (t_codes < 0).any():  # نوع فاضي: ما يدخل ترتيب الأنواع الأعلى، يروح لـ "غير محدد"
+        type_null = len(t_labels)
+        t_codes = np.where(t_codes < 0, type_null, t_codes)
+        t_labels.append("nan")
+        t_norms.append("")
+    t_norm_codes, t_norm_uniques = pd.factorize(pd.Series(t_norms, dtype=object))
+
+    nd, nt, nq = len(dept.categories), len(t_labels), len(labels)
+    q = pd.Categorical(df["_yq"], categories=labels).codes.astype(np.int64)
+    key = (((muni.codes.to_numpy().astype(np.int64) * nd + dept.codes.to_numpy()) * nt + t_codes) * nq + q) * 2
+    key = key + df["_approved"].to_numpy().astype(np.int64)
+    combos, n = np.unique(key, return_counts=True)
+
+    rest, approved = np.divmod(combos, 2)
+    rest, quarter = np.divmod(rest, nq)
+    rest, type_ = np.divmod(rest, nt)
+    muni_c, dept_c = np.divmod(rest, nd)
 
-<main class="container">
-  <div class="rows" id="rows"></div>
-</main>
+    return {
+        "version": version,
+        "labels": labels,
+        "year": year,
+        "cutoff": CUTOFF_ISO,
+        "top_types_limit": TOP_TYPES_LIMIT,
+        "other_bucket": OTHER_TYPE_BUCKET,
+        "ajada_removed_rows": int(df.attrs.get("ajada_removed_rows", 0)),
+        "size": int(len(combos)),
+        "dims": {
+            "muni": {"norms": [str(x) for x in muni.categories]},
+            "dept": {"norms": [str(x) for x in dept.categories]},
+            "type": {
+                "labels": t_labels,
+                "norms": [str(x) for x in t_norm_uniques],
+                "label_norm": t_norm_codes.tolist(),
+                "null": type_null,
+            },
+        },
+        "columns": {
+            "muni": _b64_array(muni_c),
+            "dept": _b64_array(dept_c),
+            "type": _b64_array(type_),
+            "quarter": _b64_array(quarter),
+            "approved": _b64_array(approved),
+            "n": _b64_array(n),
+        },
+    }
 
-<script>
-let charts = [];
 
-function destroyCharts(){
-  charts.forEach(c => c && c.destroy());
-  charts = [];
-}
-function sum(arr){ return arr.reduce((a,b)=>a+b,0); }
+# =========================
+# Rankings (/rankings): الترتيب محسوب مرة وحدة، والطلب مجرد قص من مصفوفة مرتبة
+# =========================
+def display_names(df: pd.DataFrame, dim: str) -> np.ndarray:
+    """
+    لكل قيمة مطبّعة (كود الـ category) أكثر كتابة متكررة لها في الملف، للعرض
+    """
+    col = df[FILTER_COLS[dim]].cat
+    names = np.array([str(x) for x in col.categories], dtype=object)
+    spellings = pd.DataFrame({"c": col.codes.to_numpy(), "raw": df[COOC_DIMS[dim]].astype(str).str.strip().to_numpy()})
+    top_spelling = spellings.value_counts(sort=True).reset_index().drop_duplicates("c")
+    names[top_spelling["c"].to_numpy()] = top_spelling["raw"].to_numpy()
+    return names
+
+@timed("build_rankings")
+def build_rankings(df: pd.DataFrame) -> Dict[str, Any]:
+    """
+    لكل بُعد: الإجمالي والمقبول لكل قيمة × ربع (+ ALL)، ولكل (ربع، مقياس) ترتيب تنازلي جاهز.
+    القيم بالتطبيع (نفس الفلاتر)، والاسم المعروض = أكثر كتابة متكررة لها
+    """
+    _, labels = period()
+    quarters = labels + ["ALL"]
+    nq = len(labels)
+    q = pd.Categorical(df["_yq"], categories=labels).codes.astype(np.int64)
+    approved_rows = df["_approved"].to_numpy()
+
+    dims: Dict[str, Any] = {}
+    for dim in COOC_DIMS:
+        col = df[FILTER_COLS[dim]].cat
+        codes = col.codes.to_numpy().astype(np.int64)
+        k = len(col.categories)
+
+        names = display_names(df, dim)
+
+        flat = codes * nq + q
+        total = np.bincount(flat, minlength=k * nq).reshape(k, nq)
+        approved = np.bincount(flat[approved_rows], minlength=k * nq).reshape(k, nq)
+        total = np.column_stack([total, total.sum(axis=1)])
+        approved = np.column_stack([approved, approved.sum(axis=1)])
+        with np.errstate(divide="ignore", invalid="ignore"):
+            rate = np.where(total > 0, approved / np.maximum(total, 1), 0.0)
+
+        valid = np.array([str(x) != "" for x in col.categories])  # القيم الفاضية ما تدخل الترتيب
+        ranks: Dict[Tuple[str, int], Dict[str, np.ndarray]] = {}
+        for j in range(len(quarters)):
+            eligible = np.flatnonzero(valid & (total[:, j] > 0))
+            for metric, values in (("total", total[:, j]), ("approved", approved[:, j]), ("rate", rate[:, j])):
+                # تنازلي بالمقياس، والتعادل بالإجمالي ثم بالاسم
+                order = eligible[np.lexsort((names[eligible], -total[eligible, j], -values[eligible]))]
+                ranks[(metric, j)] = {"order": order.astype(np.int32), "neg": -values[order].astype(np.float64)}
+
+        dims[dim] = {"names": names, "total": total, "approved": approved, "rate": rate, "ranks": ranks}
+    return {"quarters": quarters, "dims": dims}
+
+def rankings(r: Dict[str, Any], dim: str, metric: str, quarter: str, top: int,
+             percentile: Optional[float] = None) -> Dict[str, Any]:
+    """
+    top-N من الترتيب الجاهز؛ percentile=90 → فقط القيم اللي مقياسها ≥ الـ percentile 90
+    """
+    d = r["dims"][dim]
+    j = r["quarters"].index(quarter)
+    entry = d["ranks"][(metric, j)]
+    order, neg = entry["order"], entry["neg"]
+    n = len(order)
+
+    end = n
+    cutoff = None
+    if percentile is not None and n:
+        # interpolation خطي مثل np.percentile، على القيم المرتبة تصاعدياً (asc[i] = -neg[n-1-i])
+        pos = percentile / 100 * (n - 1)
+        lo, hi = int(np.floor(pos)), int(np.ceil(pos))
+        v_lo, v_hi = -neg[n - 1 - lo], -neg[n - 1 - hi]
+        threshold = float(v_lo + (v_hi - v_lo) * (pos - lo))
+        end = bisect.bisect_right(neg, -threshold)
+        cutoff = {"percentile": percentile, "value": round(threshold, 4)}
+    end = min(end, top)
+
+    items = []
+    for i, c in enumerate(order[:end]):
+        items.append({
+            "rank": i + 1,
+            "value": d["names"][c],
+            "total": int(d["total"][c, j]),
+            "approved": int(d["approved"][c, j]),
+            "rate": round(float(d["rate"][c, j]), 4),
+        })
+    return {"dim": dim, "metric": metric, "quarter": quarter, "ranked": n, "cutoff": cutoff, "items": items}
 
-function buildSingleBarWithApprovedPart(canvas, labels, total, approved){
-  const remaining = total.map((t,i)=> Math.max(0, t - approved[i]));
-  const qLabels = labels.map(x => (x.split("-")[1] || x));
 
-  const approvedColor = getComputedStyle(document.documentElement).getPropertyValue('--approved').trim();
-  const rest = getComputedStyle(document.documentElement).getPropertyValue('--remaining').trim();
+# =========================
+# Query engine (/query): group_by + filters + measures على أعمدة الأكواد
+# =========================
+_query_plans: "OrderedDict[tuple, Dict[str, Any]]" = OrderedDict()
+_query_lock = threading.Lock()
 
-  return new Chart(canvas, {
-    type: "bar",
-    data: {
-      labels: qLabels,
-      datasets: [
-        { label: "المقبولة", data: approved, stack:"s", backgroundColor: approvedColor, borderRadius: 8, borderSkipped:false },
-        { label: "_remaining", data: remaining, stack:"s", backgroundColor: rest, borderRadius: 8, borderSkipped:false }
-      ]
-    },
-    options: {
-      responsive:true,
-      maintainAspectRatio:false,
-      plugins:{
-        legend:{ labels:{ filter:(item)=> item.text === "المقبولة" } },
-        tooltip:{
-          callbacks:{
-            label:(ctx)=> ctx.dataset.label === "المقبولة" ? `المقبولة: ${ctx.parsed.y ?? 0}` : null,
-            footer:(items)=>{
-              const idx = items?.[0]?.dataIndex ?? 0;
-              const t = total[idx] ?? 0;
-              const a = approved[idx] ?? 0;
-              const rate = t ? ((a/t)*100).toFixed(1) : "0.0";
-              return `الإجمالي: ${t} | نسبة القبول: ${rate}%`;
-            }
-          }
+@timed("build_query_store")
+def build_query_store(df: pd.DataFrame) -> Dict[str, Any]:
+    """
+    كل بُعد = مصفوفة أكواد (int32) + أسماء العرض + قاموس التطبيع → الكود
+    """
+    _, quarters = period()
+
+    dims: Dict[str, Dict[str, Any]] = {}
+    for dim in COOC_DIMS:
+        col = df[FILTER_COLS[dim]].cat
+        dims[dim] = {
+            "codes": col.codes.to_numpy().astype(np.int32),
+            "labels": list(display_names(df, dim)),
+            "lookup": {str(x): i for i, x in enumerate(col.categories)},
         }
-      },
-      scales:{
-        x:{ stacked:true, grid:{display:false}, title:{display:true, text:"الربع"} },
-        y:{ stacked:true, beginAtZero:true, ticks:{precision:0}, title:{display:true, text:"عدد الاعتراضات"} }
-      }
-    }
-  });
-}
-
-function makeOption(sel, value, text){
-  const opt = document.createElement("option");
-  opt.value = value;
-  opt.textContent = text;
-  sel.appendChild(opt);
-}
-
-async function loadOptions(){
-  const r = await fetch("/options", {cache:"no-store"});
-  let j = null;
-  try { j = await r.json(); }
-  catch(e){
-    throw new Error("فشل قراءة JSON من /options (غالباً فيه خطأ 500 في السيرفر).");
-  }
-  if(!r.ok){
-    throw new Error(j?.error || "خطأ غير معروف في /options");
-  }
-
-  const selMuni = document.getElementById("selMuni");
-  const selDept = document.getElementById("selDept");
-  const selType = document.getElementById("selType");
 
-  selMuni.innerHTML = ""; selDept.innerHTML = ""; selType.innerHTML = "";
+    s_codes, s_labels = pd.factorize(df[COL_STATUS].astype(str).str.strip())
+    s_lookup: Dict[str, List[int]] = {}
+    for i, x in enumerate(s_labels):
+        s_lookup.setdefault(_norm(x), []).append(i)
+    dims["status"] = {"codes": s_codes.astype(np.int32), "labels": [str(x) for x in s_labels], "lookup": s_lookup}
 
-  makeOption(selMuni, "ALL", "كل البلديات");
-  (j.municipalities || []).forEach(x => makeOption(selMuni, x, x));
-
-  makeOption(selDept, "ALL", "كل الإدارات");
-  (j.departments || []).forEach(x => makeOption(selDept, x, x));
+    dims["quarter"] = {
+        "codes": pd.Categorical(df["_yq"], categories=quarters).codes.astype(np.int32),
+        "labels": quarters,
+        "lookup": {_norm(q): i for i, q in enumerate(quarters)},
+    }
+    return {"rows": int(len(df)), "dims": dims}
+
+def _lookup_codes(d: Dict[str, Any], values: List[str]) -> List[int]:
+    out: List[int] = []
+    for v in values:
+        hit = d["lookup"].get(_norm(v))
+        if hit is not None:
+            out.extend(hit if isinstance(hit, list) else [hit])
+    return out
 
-  makeOption(selType, "ALL", "كل أنواع الرقابة");
-  (j.types || []).forEach(x => makeOption(selType, x, x));
-}
+def parse_measure(spec: str) -> Tuple[str, Optional[str]]:
+    """
+    count | share | approved | approval_rate | count:<حالة> | rate:<حالة>
+    """
+    spec = spec.strip()
+    if spec in ("count", "share"):
+        return spec, None
+    if spec == "approved":
+        return "count", APPROVED_STATUS_VALUE
+    if spec == "approval_rate":
+        return "rate", APPROVED_STATUS_VALUE
+    kind, sep, status = spec.partition(":")
+    if sep and kind in ("count", "rate") and status.strip():
+        return kind, status.strip()
+    raise ValueError(f"measure غير معروف: {spec}")
+
+def compile_query(store: Dict[str, Any], group_by: Tuple[str, ...],
+                  filters: Tuple[Tuple[str, Tuple[str, ...]], ...], measures: Tuple[str, ...]) -> Dict[str, Any]:
+    """
+    الخطة: أبعاد التجميع ومضاعفاتها (strides)، جداول lookup للفلاتر، وأكواد الحالة لكل measure
+    """
+    for dim in group_by:
+        if dim not in QUERY_DIMS:
+            raise ValueError(f"group_by لازم يكون من {list(QUERY_DIMS)}")
+    if len(set(group_by)) != len(group_by):
+        raise ValueError("group_by فيه بُعد مكرر")
+
+    dims = store["dims"]
+    strides, size = [], 1
+    for dim in reversed(group_by):
+        strides.append(size)
+        size *= max(1, len(dims[dim]["labels"]))
+    strides.reverse()
+
+    allowed = []
+    for dim, values in filters:
+        table = np.zeros(len(dims[dim]["labels"]) + 1, dtype=bool)  # آخر خانة للكود -1
+        table[_lookup_codes(dims[dim], list(values))] = True
+        allowed.append((dim, table))
+
+    status_dim = dims["status"]
+    parsed = []
+    for spec in measures:
+        kind, status = parse_measure(spec)
+        table = None
+        if status is not None:
+            table = np.zeros(len(status_dim["labels"]) + 1, dtype=bool)
+            table[_lookup_codes(status_dim, [status])] = True
+        parsed.append({"name": spec.strip(), "kind": kind, "status": table})
+
+    return {"group_by": group_by, "strides": strides, "size": size, "filters": allowed, "measures": parsed}
+
+def cached_query_plan(store: Dict[str, Any], version: Optional[str], group_by: Tuple[str, ...],
+                      filters: Tuple[Tuple[str, Tuple[str, ...]], ...], measures: Tuple[str, ...]) -> Dict[str, Any]:
+    key = (version, group_by, filters, measures)
+    with _query_lock:
+        plan = _query_plans.get(key)
+        if plan is not None:
+            _query_plans.move_to_end(key)
+    inc("yazan_cache_requests_total", {"cache": "query_plan", "result": "miss" if plan is None else "hit"})
+    if plan is not None:
+        return plan
+
+    plan = compile_query(store, group_by, filters, measures)
+    with _query_lock:
+        _query_plans[key] = plan
+        while len(_query_plans) > QUERY_PLAN_CACHE_SIZE:
+            _query_plans.popitem(last=False)
+    return plan
+
+@timed("run_query")
+def run_query(store: Dict[str, Any], plan: Dict[str, Any], sort: str, limit: int) -> Dict[str, Any]:
+    dims = store["dims"]
+    with stage_timer("run_query.filter"):
+        mask = None
+        for dim, table in plan["filters"]:
+            m = table[dims[dim]["codes"]]
+            mask = m if mask is None else (mask & m)
+        idx = None if mask is None else np.flatnonzero(mask)
+
+    def col(dim: str) -> np.ndarray:
+        codes = dims[dim]["codes"]
+        return codes if idx is None else codes[idx]
+
+    with stage_timer("run_query.group"):
+        n = store["rows"] if idx is None else len(idx)
+        flat = np.zeros(n, dtype=np.int64)
+        for dim, stride in zip(plan["group_by"], plan["strides"]):
+            flat += col(dim).astype(np.int64) * stride
+
+        if plan["size"] <= QUERY_DENSE_MAX_CELLS:
+            groups = None
+            counts = np.bincount(flat, minlength=plan["size"])
+        else:
+            groups, flat = np.unique(flat, return_inverse=True)
+            counts = np.bincount(flat, minlength=len(groups))
+
+    with stage_timer("run_query.measures"):
+        status_codes = col("status") if any(m["status"] is not None for m in plan["measures"]) else None
+        total = int(counts.sum())
+        values: Dict[str, np.ndarray] = {}
+        for m in plan["measures"]:
+            if m["kind"] == "count" and m["status"] is None:
+                values[m["name"]] = counts
+            elif m["kind"] == "share":
+                values[m["name"]] = counts / total if total else np.zeros(len(counts))
+            else:
+                hits = np.bincount(flat[m["status"][status_codes]], minlength=len(counts))
+                if m["kind"] == "count":
+                    values[m["name"]] = hits
+                else:
+                    with np.errstate(divide="ignore", invalid="ignore"):
+                        values[m["name"]] = np.where(counts > 0, hits / np.maximum(counts, 1), 0.0)
+
+    with stage_timer("run_query.sort"):
+        # sort = measure أو بُعد من group_by (بترتيب أكواده، مثلاً الأرباع بالتسلسل)، و"-" للتنازلي
+        present = np.flatnonzero(counts)
+        desc = sort.startswith("-")
+        sort_key = sort.lstrip("-")
+        if sort_key in values or sort_key == "count":
+            key = (values.get(sort_key, counts))[present]
+        elif sort_key in plan["group_by"]:
+            i = plan["group_by"].index(sort_key)
+            flat_keys = present if groups is None else groups[present]
+            key = (flat_keys // plan["strides"][i]) % len(dims[sort_key]["labels"])
+        else:
+            raise ValueError(f"sort لازم يكون من {list(values) + list(plan['group_by'])}")
+        order = present[np.argsort(-key if desc else key, kind="stable")][:limit]
+
+    keys = order if groups is None else groups[order]
+    columns = list(plan["group_by"]) + [m["name"] for m in plan["measures"]]
+    out_rows = []
+    for pos, k in zip(order, keys):
+        row: List[Any] = []
+        for dim, stride in zip(plan["group_by"], plan["strides"]):
+            row.append(dims[dim]["labels"][(k // stride) % len(dims[dim]["labels"])])
+        for m in plan["measures"]:
+            v = values[m["name"]][pos]
+            row.append(round(float(v), 4) if m["kind"] in ("rate", "share") else int(v))
+        out_rows.append(row)
+
+    return {"columns": columns, "rows": out_rows, "groups": int(len(present)), "total": total}
 
-function renderCards(payload){
-  const rows = document.getElementById("rows");
-  rows.innerHTML = "";
-  destroyCharts();
 
-  // ✅ حذف السطرين اللي طلبتي
-  document.getElementById("subtitle").textContent = "";
-  document.getElementById("ajadaInfo").textContent = "";
+# =========================
+# Profiling عند الطلب
+# =========================
+_profile_lock = threading.Lock()  # cProfile ما يقبل أكثر من profiler شغال بنفس الوقت
+_profile_ring: deque = deque(maxlen=PROFILE_RING_SIZE)
+_profile_seq = 0
 
-  if(!payload.cards || payload.cards.length === 0){
-    const empty = document.createElement("div");
-    empty.className = "card";
-    empty.textContent = "لا توجد بيانات حسب التصفية الحالية.";
-    rows.appendChild(empty);
-    return;
-  }
+def _profile_authorized() -> bool:
+    token = request.headers.get("X-Profile-Token", "")
+    # bytes مو str: compare_digest يرمي TypeError لو النص فيه حروف غير ASCII
+    return bool(PROFILE_TOKEN) and hmac.compare_digest(token.encode("utf-8"), PROFILE_TOKEN.encode("utf-8"))
 
-  const cfg = payload.config || {};
-  const labels = cfg.labels || [];
+def _sample_stacks(tid: int, stop: threading.Event, out: Dict[str, int]) -> None:
+    """
+    sampling profiler بسيط: كل PROFILE_SAMPLE_INTERVAL ناخذ stack الـ thread
+    ونجمعها بصيغة collapsed (func;func;func count) المناسبة للـ flame graph
+    """
+    while not stop.wait(PROFILE_SAMPLE_INTERVAL):
+        frame = sys._current_frames().get(tid)
+        names = []
+        while frame is not None:
+            co = frame.f_code
+            names.append(f"{co.co_name} ({os.path.basename(co.co_filename)}:{co.co_firstlineno})")
+            frame = frame.f_back
+        if names:
+            key = ";".join(reversed(names))
+            out[key] = out.get(key, 0) + 1
+
+def _profile_report(prof: cProfile.Profile, stacks: Dict[str, int], stages: list, wall: float) -> Dict[str, Any]:
+    stats = pstats.Stats(prof).stats
+    rows = []
+    for (file, line, func), (cc, nc, tt, ct, _callers) in stats.items():
+        rows.append({
+            "func": f"{func} ({os.path.basename(file)}:{line})",
+            "calls": nc,
+            "tottime": round(tt, 6),
+            "cumtime": round(ct, 6),
+        })
+
+    stage_totals: Dict[str, float] = {}
+    for name, dt in stages:
+        stage_totals[name] = stage_totals.get(name, 0.0) + dt
 
-  payload.cards.forEach(card => {
-    const total = card.series.total;
-    const approved = card.series.approved;
+    return {
+        "wall_seconds": round(wall, 6),
+        "stages": {k: round(v, 6) for k, v in stage_totals.items()},
+        "top_cumulative": sorted(rows, key=lambda r: r["cumtime"], reverse=True)[:PROFILE_TOP_N],
+        "top_self": sorted(rows, key=lambda r: r["tottime"], reverse=True)[:PROFILE_TOP_N],
+        "collapsed": "\n".join(f"{k} {v}" for k, v in sorted(stacks.items())),
+    }
 
-    const a = sum(approved);
-    const t = sum(total);
-    const rate = t ? ((a/t)*100).toFixed(1) : "0.0";
+def _run_profiled(fn, *args, **kwargs):
+    prof = cProfile.Profile()
+    stacks: Dict[str, int] = {}
+    stop = threading.Event()
+    sampler = threading.Thread(target=_sample_stacks, args=(threading.get_ident(), stop, stacks), daemon=True)
 
-    const section = document.createElement("section");
-    section.className = "row";
+    _trace.stages = []
+    t0 = time.perf_counter()
+    sampler.start()
+    prof.enable()
+    try:
+        resp = fn(*args, **kwargs)
+    finally:
+        prof.disable()
+        wall = time.perf_counter() - t0
+        stop.set()
+        sampler.join()
+        stages, _trace.stages = _trace.stages, None
+    return resp, _profile_report(prof, stacks, stages, wall)
+
+def profiled(fn):
+    """
+    profile=1 (أو X-Profile: 1) مع التوكن: يرجّع تقرير الـ profile بدل البيانات
+    وبدون طلب: نسبة PROFILE_SAMPLE_RATE من الطلبات تنعمل لها profile، والبطيء منها ينحفظ في الـ ring
+    """
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        forced = request.args.get("profile") == "1" or request.headers.get("X-Profile") == "1"
+        if forced:
+            if not _profile_authorized():
+                return jsonify({"error": "profiling غير مصرح"}), 403
+            g.profiling = True
+            with _profile_lock:
+                resp, report = _run_profiled(fn, *args, **kwargs)
+            resp = app.make_response(resp)
+            report.update(url=request.full_path, status=resp.status_code, response_bytes=resp.content_length)
+            if request.args.get("profile_format") == "collapsed":
+                return Response(report["collapsed"] + "\n", mimetype="text/plain; charset=utf-8")
+            return jsonify(report)
+
+        if PROFILE_SAMPLE_RATE <= 0 or random.random() >= PROFILE_SAMPLE_RATE:
+            return fn(*args, **kwargs)
+        if not _profile_lock.acquire(blocking=False):
+            return fn(*args, **kwargs)
+        try:
+            resp, report = _run_profiled(fn, *args, **kwargs)
+        finally:
+            _profile_lock.release()
+
+        if report["wall_seconds"] >= PROFILE_SLOW_SEC:
+            global _profile_seq
+            with _metrics_lock:
+                _profile_seq += 1
+                report.update(id=_profile_seq, url=request.full_path, at=datetime.now().isoformat(timespec="seconds"))
+                _profile_ring.append(report)
+        return resp
+    return wrapper
 
-    section.innerHTML = `
-      <div class="card">
-        <div class="chartHead"><div class="title">${card.title}</div></div>
-        <div class="canvasWrap"><canvas id="cv-${card.slug}"></canvas></div>
-      </div>
 
-      <aside class="card">
-        <div class="kpi">
-          <div class="kpiTitle">عدد الاعتراضات المقبولة</div>
-          <div class="kpiValue">${a.toLocaleString("en-US")}</div>
-          <div class="kpiStats">
-            <div class="kpiStat">
-              <div class="kpiStatLabel">الإجمالي</div>
-              <div class="kpiStatValue">${t.toLocaleString("en-US")}</div>
-            </div>
-            <div class="kpiStat">
-              <div class="kpiStatLabel">نسبة القبول</div>
-              <div class="kpiStatValue">${rate}%</div>
-            </div>
-          </div>
-        </div>
-      </aside>
-    `;
+# =========================
+# بث التحديثات (SSE): مراقبة ملف الإكسل + broadcaster مشترك
+# =========================
+# ملاحظة: كل اتصال مفتوح ينتظر على نفس الـ Condition، فالاتصال الخامل ما يستهلك CPU،
+# لكن مع gthread يحجز thread؛ عشان كذا البث اختياري (الصفحة بـ ?live=1 لشاشات العرض)
+# وعدد الاتصالات محدود بـ EVENTS_MAX_CLIENTS (الزايد ياخذ 503؛ مع gevent الحد عالي)
+_events_cond = threading.Condition()
+_events_version: Optional[str] = None
+_events_clients = 0
+_watch_thread: Optional[threading.Thread] = None
+
+def publish_version(version: str) -> None:
+    """
+    يصحّي كل المشتركين في /events لما تتغير نسخة البيانات
+    """
+    global _events_version
+    with _events_cond:
+        changed = version != _events_version
+        _events_version = version
+        _events_cond.notify_all()
+    if changed:
+        inc("yazan_events_published_total")
+
+def wait_for_version(known: Optional[str], timeout: float) -> Optional[str]:
+    with _events_cond:
+        _events_cond.wait_for(lambda: _events_version != known, timeout)
+        return _events_version
+
+def _watch_dataset() -> None:
+    last_attempt = None
+    while True:
+        time.sleep(DATASET_WATCH_SEC)
+        try:
+            with _load_lock:
+                loaded, status = _load_state["version"], _load_state["status"]
+            if status == "loading" or loaded is None:
+                continue
+            current = dataset_version()
+            if current == loaded or current == last_attempt:
+                continue
+            last_attempt = current
+            run_cpu_bound(load_dataset)  # البيانات القديمة تبقى تخدم لين يخلص التحميل
+        except Exception as e:
+            print(f"DATASET RELOAD FAILED: {e}")
+
+def ensure_watcher() -> None:
+    global _watch_thread
+    if DATASET_WATCH_SEC <= 0:
+        return
+    with _load_lock:
+        if _watch_thread is not None and _watch_thread.is_alive():
+            return
+        _watch_thread = threading.Thread(target=_watch_dataset, name="dataset-watcher", daemon=True)
+        _watch_thread.start()
+
+def cards_delta(old: Optional[Dict[str, Any]], new: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    الفرق بين نتيجتين لنفس الفلتر: الكروت اللي تغيّرت فقط + المحذوفة + الترتيب الجديد
+    """
+    old_cards = {c["title"]: c for c in (old or {}).get("cards", [])}
+    order = [c["title"] for c in new["cards"]]
+    kept = set(order)
+    delta = {
+        "changed": [c for c in new["cards"] if old_cards.get(c["title"]) != c],
+        "removed": [t for t in old_cards if t not in kept],
+        "order": order,
+    }
+    if old is None or old["config"].get("labels") != new["config"].get("labels"):
+        delta["labels"] = new["config"].get("labels")
+    return delta
 
-    rows.appendChild(section);
+def _sse(event: str, payload: Any, event_id: Optional[str] = None) -> str:
+    head = f"id: {event_id}\n" if event_id else ""
+    return f"{head}event: {event}\ndata: {dumps_json(payload).decode('utf-8')}\n\n"
 
-    const canvas = document.getElementById(`cv-${card.slug}`);
-    charts.push(buildSingleBarWithApprovedPart(canvas, labels, total, approved));
-  });
-}
+def event_stream(muni: FilterValue, dept: FilterValue, type_: FilterValue, since: Optional[str]):
+    """
+    أول رسالة ready بالنسخة الحالية، وبعدها update (delta) مع كل نسخة جديدة.
+    النتيجة نفسها من cached_build_data، فكل الشاشات اللي على نفس الفلتر تشترك بحساب واحد
+    """
+    df, version = _cached_df()
+    known, prev = version, None
+    if df is not None:
+        if since in (None, version):
+            prev = cached_build_data(df, version, muni, dept, type_)
+        else:
+            known = since  # العميل عنده نسخة أقدم: أول update يرسل كل الكروت
+    yield "retry: 5000\n\n"
+    yield _sse("ready", {"version": version})
+
+    while True:
+        current = wait_for_version(known, EVENTS_HEARTBEAT_SEC)
+        if current == known:
+            yield ": ping\n\n"
+            continue
+        df, current = _cached_df()
+        if df is None:
+            continue
+        payload = cached_build_data(df, current, muni, dept, type_)
+        with stage_timer("events.delta"):
+            delta = cards_delta(prev, payload)
+        yield _sse("update", {"version": current, "previous": known, **delta}, current)
+        inc("yazan_events_sent_total", {"event": "update"})
+        prev, known = payload, current
+
+def acquire_event_slot() -> bool:
+    global _events_clients
+    with _events_cond:
+        if _events_clients >= EVENTS_MAX_CLIENTS:
+            return False
+        _events_clients += 1
+        set_gauge("yazan_events_clients", _events_clients)
+    return True
+
+def release_event_slot() -> None:
+    global _events_clients
+    with _events_cond:
+        _events_clients -= 1
+        set_gauge("yazan_events_clients", _events_clients)
 
-async function loadData(){
-  const muni = document.getElementById("selMuni").value;
-  const dept = document.getElementById("selDept").value;
-  const type = document.getElementById("selType").value;
-
-  const qs = new URLSearchParams({muni, dept, type}).toString();
-  const r = await fetch(`/data?${qs}`, {cache:"no-store"});
-  let j = null;
-  try { j = await r.json(); }
-  catch(e){
-    throw new Error("فشل قراءة JSON من /data (غالباً فيه خطأ 500 في السيرفر).");
-  }
-  if(!r.ok){
-    throw new Error(j?.error || "خطأ غير معروف في /data");
-  }
-  renderCards(j);
-}
 
-document.getElementById("btnApply").addEventListener("click", async ()=> {
-  try { await loadData(); }
-  catch(e){
-    const rows = document.getElementById("rows");
-    rows.innerHTML = `<div class="card">خطأ: ${e.message}</div>`;
-  }
-});
+# =========================
+# Serialization: orjson لو موجود + صيغة columnar / MessagePack
+# =========================
+MSGPACK_MIMETYPES = ("application/msgpack", "application/x-msgpack")
+
+def _json_default(o: Any) -> Any:
+    if isinstance(o, np.generic):
+        return o.item()
+    if isinstance(o, np.ndarray):
+        return o.tolist()
+    if isinstance(o, (datetime, date)):
+        return o.isoformat()
+    raise TypeError(f"Object of type {type(o).__name__} is not JSON serializable")
+
+def dumps_json(payload: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(payload, default=_json_default, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":"), default=_json_default).encode("utf-8")
+
+def columnar_cards(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    نفس نتيجة /data لكن الكروت مصفوفات متوازية (بدون تكرار أسماء المفاتيح لكل كرت):
+    cards.title[i] ↔ cards.total[i] ↔ cards.approved[i]
+    """
+    cards = payload["cards"]
+    out = {k: v for k, v in payload.items() if k != "cards"}
+    out["format"] = "columnar"
+    out["cards"] = {
+        "title": [c["title"] for c in cards],
+        "slug": [c["slug"] for c in cards],
+        "dim": [c.get("dim") for c in cards],
+        "value": [c.get("value") for c in cards],
+        "total": [c["series"]["total"] for c in cards],
+        "approved": [c["series"]["approved"] for c in cards],
+    }
+    return out
 
-(async function init(){
-  try{
-    await loadOptions();
-    await loadData();
-  }catch(e){
-    console.error(e);
-    const rows = document.getElementById("rows");
-    rows.innerHTML = `<div class="card">خطأ: ${e.message}</div>`;
-  }
-})();
-</script>
+def _wants_msgpack() -> bool:
+    if msgpack is None:
+        return False
+    best = request.accept_mimetypes.best_match(("application/json",) + MSGPACK_MIMETYPES)
+    return best in MSGPACK_MIMETYPES
 
-</body>
-</html>
-"""
 
 # =========================
 # Routes
 # =========================
-_df_cache = None
+def filter_arg(name: str) -> FilterValue:
+    """
+    muni=a&muni=b -> ["a", "b"]، قيمة وحدة -> "a"، بدون/ALL -> "ALL"
+    """
+    values = [v.strip() for v in request.args.getlist(name)]
+    values = list(dict.fromkeys(v for v in values if v and v != "ALL"))
+    if not values:
+        return "ALL"
+    return values[0] if len(values) == 1 else values
+
+def _json(payload: Any, status: int = 200):
+    """
+    ?format=columnar أو Accept: application/msgpack → الكروت كمصفوفات متوازية
+    """
+    msgpack_ok = _wants_msgpack()
+    if isinstance(payload, dict) and "cards" in payload and (msgpack_ok or request.args.get("format") == "columnar"):
+        payload = columnar_cards(payload)
+
+    if msgpack_ok:
+        with stage_timer("serialize_msgpack"):
+            body = msgpack.packb(payload, use_bin_type=True, default=_json_default)
+        resp = Response(body, status=status, mimetype=MSGPACK_MIMETYPES[0])
+    else:
+        with stage_timer("serialize_json"):
+            body = dumps_json(payload)
+        resp = Response(body, status=status, mimetype="application/json")
+    if msgpack is not None:
+        resp.vary.add("Accept")
+    return resp
+
+@app.before_request
+def _metrics_start():
+    g._t0 = time.perf_counter()
+
+@app.after_request
+def _metrics_end(resp):
+    t0 = g.pop("_t0", None)
+    if t0 is None:
+        return resp
+    route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+    observe("yazan_http_request_duration_seconds", time.perf_counter() - t0, {"route": route})
+    inc("yazan_http_requests_total", {"route": route, "method": request.method, "status": str(resp.status_code)})
+    if not resp.is_streamed and resp.content_length is not None:
+        observe("yazan_http_response_size_bytes", resp.content_length, {"route": route}, buckets=SIZE_BUCKETS)
+    return resp
+
+# ✅ ضغط JSON/MessagePack حسب Accept-Encoding (مسجّل بعد الـ metrics عشان يشتغل قبله ونقيس الحجم الفعلي)
+@app.after_request
+def _compress_json(resp):
+    if (
+        resp.direct_passthrough
+        or resp.is_streamed
+        or resp.status_code != 200
+        or resp.mimetype not in ("application/json",) + MSGPACK_MIMETYPES
+        or "Content-Encoding" in resp.headers
+    ):
+        return resp
+    resp.vary.add("Accept-Encoding")
+    body = resp.get_data()
+    if len(body) < COMPRESS_MIN_BYTES:
+        return resp
+
+    enc = _accepted_encoding(("br", "gzip") if brotli is not None else ("gzip",))
+    if enc == "identity":
+        return resp
+    with stage_timer("compress_json"):
+        resp.set_data(brotli.compress(body, quality=4) if enc == "br" else gzip.compress(body, 5))
+    resp.headers["Content-Encoding"] = enc
+    return resp
 
 @app.route("/")
 def index():
-    return Response(HTML, mimetype="text/html; charset=utf-8")
+    return _asset_response(_page, "no-cache")
+
+@app.route("/assets/<path:name>")
+def assets(name: str):
+    asset = _assets.get(name)
+    if asset is None:
+        return jsonify({"error": "الملف غير موجود"}), 404
+    return _asset_response(asset, ASSET_CACHE_CONTROL)
+
+@app.route("/metrics")
+def metrics():
+    st = dataset_status()
+    if st["age_seconds"] is not None:
+        set_gauge("yazan_dataset_age_seconds", st["age_seconds"])
+    return Response(render_metrics(), mimetype="text/plain; version=0.0.4; charset=utf-8")
+
+@app.route("/healthz")
+def healthz():
+    # ✅ السيرفر شغال (حتى لو البيانات لسه تتحمل)
+    return jsonify({"ok": True, "dataset": dataset_status()})
+
+@app.route("/readyz")
+def readyz():
+    # ✅ للـ load balancer: 200 فقط لما تكون البيانات جاهزة
+    st = dataset_status()
+    ready = _df_cache is not None
+    if not ready:
+        ensure_warmup()
+    return jsonify({"ready": ready, "dataset": st}), (200 if ready else 503)
+
+@app.route("/debug/profiles")
+def debug_profiles():
+    if not _profile_authorized():
+        return jsonify({"error": "profiling غير مصرح"}), 403
+    items = list(_profile_ring)
+    return jsonify([
+        {"id": p["id"], "url": p["url"], "at": p["at"], "wall_seconds": p["wall_seconds"], "stages": p["stages"]}
+        for p in reversed(items)
+    ])
+
+@app.route("/debug/profiles/<int:pid>")
+def debug_profile(pid: int):
+    if not _profile_authorized():
+        return jsonify({"error": "profiling غير مصرح"}), 403
+    for p in list(_profile_ring):
+        if p["id"] == pid:
+            if request.args.get("format") == "collapsed":
+                return Response(p["collapsed"] + "\n", mimetype="text/plain; charset=utf-8")
+            return jsonify(p)
+    return jsonify({"error": "profile غير موجود"}), 404
 
 @app.route("/options")
+@profiled
 def options():
     try:
-        global _df_cache
-        if _df_cache is None:
-            _df_cache = prepare_df()
-        return jsonify(build_options(_df_cache))
+        df, _version = _cached_df()
+        with _load_lock:
+            co = _cooc_index
+        if df is None or co is None:
+            return _not_ready_response()
+
+        selections = {dim: filter_arg(dim) for dim in COOC_DIMS}
+        return _json(cascade_options(co, selections))
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+def _list_arg(name: str) -> List[str]:
+    # group_by=dept,status أو group_by=dept&group_by=status
+    return [x.strip() for v in request.args.getlist(name) for x in v.split(",") if x.strip()]
+
+@app.route("/query")
+@profiled
+def query():
+    try:
+        with _load_lock:
+            store, version = _query_store, _load_state["version"]
+        if store is None:
+            return _not_ready_response()
+
+        group_by = tuple(_list_arg("group_by"))
+        measures = tuple(dict.fromkeys(_list_arg("measures") or ["count"]))
+        filters = []
+        for dim in QUERY_DIMS:
+            key = filter_key(filter_arg(dim))
+            if key != "ALL":
+                filters.append((dim, key if isinstance(key, tuple) else (key,)))
+        filters = tuple(filters)
+        sort = request.args.get("sort", "-count")
+        try:
+            limit = min(QUERY_LIMIT_MAX, max(1, int(request.args.get("limit", QUERY_LIMIT_DEFAULT))))
+        except ValueError:
+            return jsonify({"error": "limit لازم يكون رقم"}), 400
+
+        try:
+            plan = cached_query_plan(store, version, group_by, filters, measures)
+            result = run_query(store, plan, sort, limit)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        result.update(group_by=list(group_by), measures=list(measures), filters={d: list(v) for d, v in filters})
+        return _json(result)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route("/rankings")
+def rankings_route():
+    try:
+        with _load_lock:
+            r = _rankings_cache
+        if r is None:
+            return _not_ready_response()
+
+        dim = request.args.get("dim", "")
+        if dim not in r["dims"]:
+            return jsonify({"error": f"dim لازم يكون واحد من {list(r['dims'])}"}), 400
+        metric = request.args.get("metric", "rate")
+        if metric not in RANKING_METRICS:
+            return jsonify({"error": f"metric لازم يكون واحد من {list(RANKING_METRICS)}"}), 400
+        quarter = request.args.get("quarter", "ALL")
+        if quarter not in r["quarters"]:
+            return jsonify({"error": f"quarter لازم يكون واحد من {r['quarters']}"}), 400
+        try:
+            top = min(RANKING_TOP_MAX, max(1, int(request.args.get("top", RANKING_TOP_DEFAULT))))
+            percentile = request.args.get("percentile")
+            percentile = None if percentile in (None, "") else float(percentile)
+        except ValueError:
+            return jsonify({"error": "top/percentile لازم تكون أرقام"}), 400
+        if percentile is not None and not 0 <= percentile <= 100:
+            return jsonify({"error": "percentile لازم يكون بين 0 و 100"}), 400
+
+        return _json(rankings(r, dim, metric, quarter, top, percentile))
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route("/options/suggest")
+def options_suggest():
+    try:
+        with _load_lock:
+            index, co = _suggest_index, _cooc_index
+        if index is None or co is None:
+            return _not_ready_response()
+
+        field = request.args.get("field", "")
+        if field not in SUGGEST_FIELDS:
+            return jsonify({"error": f"field لازم يكون واحد من {list(SUGGEST_FIELDS)}"}), 400
+        try:
+            limit = min(SUGGEST_LIMIT_MAX, max(1, int(request.args.get("limit", SUGGEST_LIMIT_DEFAULT))))
+        except ValueError:
+            return jsonify({"error": "limit لازم يكون رقم"}), 400
+
+        # ✅ لو فيه اختيارات في الحقول الثانية نقترح فقط القيم اللي تجتمع معها
+        selections = {dim: filter_arg(dim) for dim in COOC_DIMS}
+        cascade = None
+        if any(filter_values(v) for dim, v in selections.items() if dim != field):
+            cascade = cascade_counts(co, field, selections)
+
+        return _json({"field": field, "suggestions": suggest(index, field, request.args.get("q", ""), limit, cascade)})
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 @app.route("/data")
+@profiled
 def data():
     try:
-        global _df_cache
-        if _df_cache is None:
-            _df_cache = prepare_df()
+        df, version = _cached_df()
+        if df is None:
+            return _not_ready_response()
 
-        muni = request.args.get("muni", "ALL")
-        dept = request.args.get("dept", "ALL")
-        type_ = request.args.get("type", "ALL")
+        muni, dept, type_ = filter_arg("muni"), filter_arg("dept"), filter_arg("type")
 
-        return jsonify(build_data(_df_cache, muni, dept, type_))
+        try:
+            offset = max(0, int(request.args.get("offset", 0)))
+            limit = request.args.get("limit")
+            limit = None if limit in (None, "") else min(CARDS_PAGE_MAX, max(1, int(limit)))
+        except ValueError:
+            return jsonify({"error": "offset/limit لازم تكون أرقام"}), 400
+
+        payload = cached_build_data(df, version, muni, dept, type_)
+        return _json(page_cards(payload, offset, limit))
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@app.route("/cube")
+def cube():
+    # ✅ نفس النسخة = نفس المكعّب: /cube بدون v (أو بنسخة قديمة) يحوّل لـ /cube?v=<version>
+    # اللي يتخزّن في المتصفح للأبد، والجسم نفسه مضغوط مسبقاً وقت التحميل
+    with _load_lock:
+        asset, version = _cube_cache, _load_state["version"]
+    if asset is None:
+        return _not_ready_response()
+
+    if request.args.get("v") != version:
+        resp = redirect(f"/cube?v={version}", code=302)
+        resp.headers["Cache-Control"] = "no-cache"
+        return resp
+    return _asset_response(asset, "public, max-age=31536000, immutable")
+
+@app.route("/events")
+def events():
+    # ✅ SSE: الشاشات تشترك بفلترها وتستقبل delta للكروت لما تتغير البيانات بدل ما تسوي polling
+    ensure_watcher()
+    ensure_warmup()
+    if not acquire_event_slot():
+        inc("yazan_events_rejected_total")
+        resp = jsonify({"error": "عدد اتصالات البث المباشر وصل الحد، حاول لاحقاً"})
+        resp.status_code = 503
+        resp.headers["Retry-After"] = "60"
+        return resp
+
+    since = request.headers.get("Last-Event-ID") or request.args.get("since") or None
+    stream = event_stream(filter_arg("muni"), filter_arg("dept"), filter_arg("type"), since)
+    resp = Response(stream, mimetype="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",  # عشان nginx ما يخزّن الرسائل
+    })
+    resp.call_on_close(release_event_slot)  # يتنادى حتى لو انقطع الاتصال قبل أول رسالة
+    return resp
+
+@app.route("/rows")
+@profiled
+def rows():
+    try:
+        with _load_lock:
+            df, raw, idx, version = _df_cache, _raw_cache, _rows_index, _load_state["version"]
+        if df is None or raw is None or idx is None:
+            return _not_ready_response()
+
+        columns = [c.strip() for c in ",".join(request.args.getlist("columns")).split(",") if c.strip()]
+        columns = columns or [c for c in ROWS_DEFAULT_COLUMNS if c in raw.columns]
+        unknown = [c for c in columns if c not in raw.columns]
+        if unknown:
+            return jsonify({"error": f"أعمدة غير موجودة: {unknown}"}), 400
+
+        try:
+            limit = min(ROWS_PAGE_MAX, max(1, int(request.args.get("limit", ROWS_PAGE_DEFAULT))))
+            cursor = request.args.get("cursor") or None
+            if cursor:
+                decode_cursor(cursor)
+        except (ValueError, UnicodeDecodeError):
+            return jsonify({"error": "limit أو cursor غير صالح"}), 400
+
+        return _json(build_rows(
+            df, raw, idx, version,
+            filter_arg("muni"), filter_arg("dept"), filter_arg("type"),
+            request.args.get("quarter", "ALL"),
+            cursor, limit, columns,
+        ))
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route("/search")
+@profiled
+def search_route():
+    try:
+        with _load_lock:
+            df, index = _df_cache, _search_index
+        if df is None or index is None:
+            return _not_ready_response()
+
+        q = request.args.get("q", "").strip()
+        if not parse_search_query(q):
+            return jsonify({"error": "لازم تكتب كلمة بحث (q)"}), 400
+
+        return _json(search(
+            df, index, q,
+            filter_arg("muni"), filter_arg("dept"), filter_arg("type"),
+        ))
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route("/export")
+def export():
+    try:
+        with _load_lock:
+            df, raw = _df_cache, _raw_cache
+        if df is None or raw is None:
+            return _not_ready_response()
+
+        muni, dept, type_ = filter_arg("muni"), filter_arg("dept"), filter_arg("type")
+        fmt = request.args.get("format", "csv")
+        if fmt not in ("csv", "xlsx"):
+            return jsonify({"error": "format لازم يكون csv أو xlsx"}), 400
+
+        mask = filter_mask(df, muni, dept, type_)
+        index = df.index if mask is None else df.index[mask]  # بدون نسخ أعمدة الصفوف
+        if fmt == "xlsx" and len(index) > EXPORT_XLSX_MAX_ROWS:
+            return jsonify({
+                "error": f"عدد الصفوف {len(index)} أكبر من حد XLSX ({EXPORT_XLSX_MAX_ROWS})، استخدم CSV أو ضيّق الفلتر",
+                "rows": int(len(index)),
+                "limit": EXPORT_XLSX_MAX_ROWS,
+            }), 413
+        filename = f"objections_{datetime.now():%Y%m%d_%H%M}.{fmt}"
+        headers = {"Content-Disposition": f'attachment; filename="{filename}"', "X-Row-Count": str(len(index))}
+
+        if fmt == "csv":
+            return Response(iter_export_csv(raw, index), mimetype="text/csv; charset=utf-8", headers=headers)
+        return Response(
+            iter_export_xlsx(raw, index),
+            mimetype="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+            headers=headers,
+        )
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+if WARMUP_ON_BOOT:
+    ensure_warmup()
+    ensure_watcher()
 
 # ✅ تشغيل مناسب للنشر (Render وغيره)
 if __name__ == "__main__":
@@ -0,0 +1,6 @@
+"""
+Benchmarks لمسار تحميل البيانات والاستعلامات (بيانات وهمية، بدون ملف الإكسل الحقيقي)
+
+    python -m bench.synth 100k            # توليد ملف إكسل وهمي
+    python -m bench.run --sizes 10k,100k   # قياس الوقت والذاكرة ومقارنتها بالـ baseline
+"""
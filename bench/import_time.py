@@ -0,0 +1,94 @@
+"""
+Benchmark لوقت `import app` (الإقلاع البارد لكل worker)
+
+يشغّل `import app` في process جديد عدة مرات (median)، ويتأكد إن pandas/numpy/openpyxl
+ما انستوردت وقت الإقلاع (تتأجل لين أول استخدام للبيانات)؛ يفشل (exit 1) لو تجاوز --budget
+أو لو انستورد موديول ثقيل.
+
+    python -m bench.import_time
+    python -m bench.import_time --budget 0.5 --repeat 10 --top 15
+"""
+from __future__ import annotations
+
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+from typing import Dict, List, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ("pandas", "numpy", "openpyxl")
+DEFAULT_BUDGET = 0.6  # ثواني
+
+_PROBE = f"""
+import sys, time, json
+t0 = time.perf_counter()
+import app
+dt = time.perf_counter() - t0
+print(json.dumps({{"seconds": dt, "heavy": [m for m in {HEAVY_MODULES!r} if m in sys.modules]}}))
+"""
+
+
+def _env() -> Dict[str, str]:
+    env = dict(os.environ)
+    env["WARMUP_ON_BOOT"] = "0"  # بدون تحميل الإكسل في الخلفية
+    env["DATASET_WATCH_SEC"] = "0"
+    return env
+
+
+def probe() -> Dict[str, object]:
+    out = subprocess.run(
+        [sys.executable, "-c", _PROBE], cwd=ROOT, env=_env(), check=True, capture_output=True, text=True,
+    )
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def import_profile(top: int) -> List[Tuple[int, str]]:
+    """
+    أثقل الموديولات حسب -X importtime (cumulative بالمايكروثانية)
+    """
+    out = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app"], cwd=ROOT, env=_env(),
+        check=True, capture_output=True, text=True,
+    )
+    rows = []
+    for line in out.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _self, cumulative, name = (x.strip() for x in line[len("import time:"):].split("|"))
+        rows.append((int(cumulative), name.strip()))
+    return sorted(rows, reverse=True)[:top]
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--budget", type=float, default=DEFAULT_BUDGET, help="أقصى median مسموح بالثواني")
+    ap.add_argument("--top", type=int, default=0, help="اطبع أثقل N موديولات (-X importtime)")
+    args = ap.parse_args(argv)
+
+    runs = [probe() for _ in range(args.repeat)]
+    median = statistics.median(r["seconds"] for r in runs)
+    heavy = sorted({m for r in runs for m in r["heavy"]})
+
+    print(f"import app: median {median * 1000:.1f} ms over {args.repeat} runs (budget {args.budget * 1000:.0f} ms)")
+    if args.top:
+        for cumulative, name in import_profile(args.top):
+            print(f"  {cumulative / 1000:8.1f} ms  {name}")
+
+    failed = False
+    if heavy:
+        print(f"FAIL: heavy modules imported at boot: {', '.join(heavy)}")
+        failed = True
+    if median > args.budget:
+        print(f"FAIL: import time {median:.3f}s > budget {args.budget:.3f}s")
+        failed = True
+    if not failed:
+        print("OK")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,313 @@
+"""
+Load test محلي لـ Flask/gunicorn: يشغّل السيرفر بإعدادات workers/threads مختلفة،
+ويحاكي مستخدمين متزامنين يعيدون تسلسل init() في الصفحة (/ ثم /cube ثم أول صفحة من /data
+columnar) وبعدها تغييرات فلاتر عشوائية من قيم /options الحقيقية (نفس طلب loadPage).
+/events ما تفتحه إلا شاشات العرض (?live=1)، فـ --live N يفتح N اتصالات SSE طول مدة الاختبار.
+
+    python -m bench.loadtest --size 100k --configs 1x1,2x4,4x8 --concurrency 16 --duration 30
+    python -m bench.loadtest --url http://127.0.0.1:8000 --concurrency 8   # سيرفر شغال مسبقاً
+    python -m bench.loadtest --size 10k --configs 1x16 --live 4
+"""
+from __future__ import annotations
+
+import os
+import sys
+import gzip
+import json
+import time
+import random
+import socket
+import argparse
+import threading
+import subprocess
+import http.client
+from urllib.parse import urlencode, urlsplit
+from typing import Any, Dict, List, Optional, Tuple
+
+from bench import synth
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+READY_TIMEOUT_SEC = 600
+PAGE_SIZE = 8  # نفس PAGE_SIZE في الصفحة
+MAX_REDIRECTS = 3
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _percentile(sorted_vals: List[float], p: float) -> float:
+    if not sorted_vals:
+        return 0.0
+    k = max(0, min(len(sorted_vals) - 1, int(round(p / 100 * len(sorted_vals) + 0.5)) - 1))
+    return sorted_vals[k]
+
+
+class _Client:
+    """
+    اتصال keep-alive واحد لكل مستخدم وهمي (مثل المتصفح)
+    """
+
+    def __init__(self, base: str):
+        u = urlsplit(base)
+        self.host, self.port = u.hostname, u.port or 80
+        self.conn: Optional[http.client.HTTPConnection] = None
+
+    def _request(self, path: str) -> Tuple[int, Optional[str], bytes]:
+        for attempt in range(2):
+            try:
+                if self.conn is None:
+                    self.conn = http.client.HTTPConnection(self.host, self.port, timeout=120)
+                self.conn.request("GET", path, headers={"Accept-Encoding": "gzip"})
+                r = self.conn.getresponse()
+                body = r.read()
+                if r.getheader("Content-Encoding") == "gzip":
+                    body = gzip.decompress(body)
+                return r.status, r.getheader("Location"), body
+            except (http.client.HTTPException, OSError):
+                if self.conn is not None:
+                    self.conn.close()
+                self.conn = None
+                if attempt:
+                    raise
+        raise RuntimeError("unreachable")
+
+    def get(self, path: str) -> Tuple[int, bytes]:
+        """
+        مثل fetch(): يفك gzip ويتبع التحويلات (/cube → /cube?v=<version>)
+        """
+        for _ in range(MAX_REDIRECTS + 1):
+            status, location, body = self._request(path)
+            if status not in (301, 302, 303, 307, 308) or not location:
+                return status, body
+            u = urlsplit(location)
+            path = u.path + (f"?{u.query}" if u.query else "")
+        return status, body
+
+
+def _route(path: str) -> str:
+    return path.split("?", 1)[0]
+
+
+def _user(base: str, options: Dict[str, List[str]], stop_at: float, think: float, seed: int,
+          samples: List[Tuple[str, float, int]], lock: threading.Lock) -> None:
+    rng = random.Random(seed)
+    client = _Client(base)
+    local: List[Tuple[str, float, int]] = []
+
+    def hit(path: str) -> None:
+        t0 = time.perf_counter()
+        try:
+            status, _ = client.get(path)
+        except Exception:
+            status = 0
+        local.append((_route(path), time.perf_counter() - t0, status))
+
+    def pick(values: List[str]) -> List[str]:
+        return [rng.choice(values)] if values and rng.random() < 0.5 else []
+
+    page = {"offset": 0, "limit": PAGE_SIZE, "format": "columnar"}
+
+    # نفس تسلسل init() في الصفحة (/events بس مع ?live=1، شوف --live)
+    hit("/")
+    hit("/cube")
+    hit("/data?" + urlencode(page))
+
+    while time.time() < stop_at:
+        qs = urlencode({
+            "muni": pick(options.get("municipalities", [])),
+            "dept": pick(options.get("departments", [])),
+            "type": pick(options.get("types", [])),
+            **page,
+        }, doseq=True)
+        hit(f"/data?{qs}")
+        if think:
+            time.sleep(rng.expovariate(1 / think))
+
+    with lock:
+        samples.extend(local)
+
+
+def _live_screen(base: str, stop_at: float, samples: List[Tuple[str, float, int]], lock: threading.Lock) -> None:
+    """
+    شاشة عرض (?live=1): اتصال /events مفتوح لين نهاية الاختبار؛ الزمن المسجّل لين أول رسالة (ready)
+    """
+    u = urlsplit(base)
+    conn = http.client.HTTPConnection(u.hostname, u.port or 80, timeout=max(1.0, stop_at - time.time()))
+    t0 = time.perf_counter()
+    status, dt = 0, 0.0
+    try:
+        conn.request("GET", "/events")
+        r = conn.getresponse()
+        status = r.status
+        if status == 200:
+            r.readline()  # retry: ...
+            r.readline()
+            r.readline()  # event: ready
+        dt = time.perf_counter() - t0
+        while status == 200 and time.time() < stop_at and r.readline():
+            pass
+    except (http.client.HTTPException, OSError):
+        dt = dt or time.perf_counter() - t0
+    finally:
+        conn.close()
+    with lock:
+        samples.append(("/events", dt, status))
+
+
+def wait_ready(base: str, timeout: float = READY_TIMEOUT_SEC) -> float:
+    t0 = time.time()
+    client = _Client(base)
+    while time.time() - t0 < timeout:
+        try:
+            status, _ = client.get("/readyz")
+            if status == 200:
+                return time.time() - t0
+        except OSError:
+            pass
+        time.sleep(0.25)
+    raise TimeoutError(f"السيرفر ما صار جاهز خلال {timeout}s")
+
+
+def run_load(base: str, concurrency: int, duration: float, think: float, seed: int, live: int = 0) -> Dict[str, Any]:
+    # قيم الفلاتر الحقيقية (تجهيز، ما يدخل في القياس)
+    status, body = _Client(base).get("/options")
+    if status != 200:
+        raise RuntimeError(f"/options رجّع {status}")
+    options = json.loads(body)
+
+    samples: List[Tuple[str, float, int]] = []
+    lock = threading.Lock()
+    t0 = time.time()
+    stop_at = t0 + duration
+    users = [
+        threading.Thread(target=_user, args=(base, options, stop_at, think, seed + i, samples, lock), daemon=True)
+        for i in range(concurrency)
+    ] + [
+        threading.Thread(target=_live_screen, args=(base, stop_at, samples, lock), daemon=True)
+        for _ in range(live)
+    ]
+    for u in users:
+        u.start()
+    for u in users:
+        u.join()
+    wall = time.time() - t0
+
+    by_route: Dict[str, List[float]] = {}
+    errors: Dict[str, int] = {}
+    for route, dt, st in samples:
+        by_route.setdefault(route, []).append(dt)
+        if st != 200:
+            errors[route] = errors.get(route, 0) + 1
+
+    def summary(vals: List[float], route: Optional[str] = None) -> Dict[str, Any]:
+        vals = sorted(vals)
+        return {
+            "requests": len(vals),
+            "errors": errors.get(route, 0) if route else sum(n for r, n in errors.items() if r != "/events"),
+            "rps": round(len(vals) / wall, 1) if wall else 0,
+            "p50_ms": round(_percentile(vals, 50) * 1000, 1),
+            "p95_ms": round(_percentile(vals, 95) * 1000, 1),
+            "p99_ms": round(_percentile(vals, 99) * 1000, 1),
+            "max_ms": round(vals[-1] * 1000, 1) if vals else 0,
+        }
+
+    return {
+        "concurrency": concurrency,
+        "live": live,
+        "duration_seconds": round(wall, 1),
+        "all": summary([dt for route, dt, _ in samples if route != "/events"]),  # /events مفتوح طول المدة
+        "routes": {r: summary(v, r) for r, v in sorted(by_route.items())},
+    }
+
+
+def start_server(workers: int, threads: int, port: int, excel_path: Optional[str]) -> subprocess.Popen:
+    env = dict(os.environ)
+    if excel_path:
+        env["EXCEL_PATH"] = excel_path
+    cmd = [
+        sys.executable, "-m", "gunicorn", "app:app",
+        "-b", f"127.0.0.1:{port}",
+        "-w", str(workers),
+        "--threads", str(threads),
+        "-k", "gthread" if threads > 1 else "sync",
+        "--timeout", "300",
+        "--log-level", "warning",
+    ]
+    return subprocess.Popen(cmd, cwd=ROOT, env=env)
+
+
+def print_report(name: str, r: Dict[str, Any]) -> None:
+    print(f"\n== {name}  (concurrency={r['concurrency']}, live={r.get('live', 0)}, {r['duration_seconds']}s"
+          + (f", ready in {r['ready_seconds']:.1f}s" if "ready_seconds" in r else "") + ")")
+    print(f"  {'route':<12}{'reqs':>8}{'err':>6}{'rps':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for route, s in list(r["routes"].items()) + [("ALL", r["all"])]:
+        print(f"  {route:<12}{s['requests']:>8}{s['errors']:>6}{s['rps']:>9}"
+              f"{s['p50_ms']:>10}{s['p95_ms']:>10}{s['p99_ms']:>10}{s['max_ms']:>10}")
+
+
+def print_comparison(results: Dict[str, Dict[str, Any]]) -> None:
+    print("\n== comparison (/data)")
+    print(f"  {'config':<10}{'rps':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}{'ready s':>9}")
+    for name, r in results.items():
+        s = r["routes"].get("/data", r["all"])
+        print(f"  {name:<10}{s['rps']:>9}{s['p50_ms']:>10}{s['p95_ms']:>10}{s['p99_ms']:>10}"
+              f"{s['errors']:>8}{r.get('ready_seconds', 0):>9.1f}")
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="load test محلي للوحة الاعتراضات")
+    ap.add_argument("--configs", default="1x1,2x4,4x4", help="workers x threads مفصولة بفاصلة")
+    ap.add_argument("--concurrency", type=int, default=16, help="عدد المستخدمين المتزامنين")
+    ap.add_argument("--duration", type=float, default=20, help="ثواني لكل إعداد")
+    ap.add_argument("--live", type=int, default=0, help="عدد شاشات العرض (اتصالات /events مفتوحة)")
+    ap.add_argument("--think", type=float, default=0, help="متوسط وقت التفكير بين الطلبات (ثواني)")
+    ap.add_argument("--size", default=None, choices=list(synth.SIZES), help="استخدام ملف وهمي بدل الإكسل الحقيقي")
+    ap.add_argument("--excel", default=None, help="مسار ملف إكسل محدد")
+    ap.add_argument("--url", default=None, help="سيرفر شغال مسبقاً (بدون تشغيل gunicorn)")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--json", default=None, help="حفظ التقرير في JSON")
+    args = ap.parse_args(argv)
+
+    excel = args.excel
+    if args.size:
+        excel = synth.workbook_path(args.size)
+        if excel is None:
+            ap.error(f"{args.size} أكبر من حد الإكسل")
+
+    results: Dict[str, Dict[str, Any]] = {}
+    if args.url:
+        wait_ready(args.url)
+        results["external"] = r = run_load(args.url, args.concurrency, args.duration, args.think, args.seed, args.live)
+        print_report(args.url, r)
+    else:
+        for cfg in [c.strip() for c in args.configs.split(",") if c.strip()]:
+            workers, threads = (int(x) for x in cfg.lower().split("x"))
+            port = _free_port()
+            base = f"http://127.0.0.1:{port}"
+            proc = start_server(workers, threads, port, excel)
+            try:
+                ready = wait_ready(base)
+                r = run_load(base, args.concurrency, args.duration, args.think, args.seed, args.live)
+                r.update(workers=workers, threads=threads, ready_seconds=round(ready, 2))
+                results[cfg] = r
+                print_report(f"{workers} workers x {threads} threads", r)
+            finally:
+                proc.terminate()
+                try:
+                    proc.wait(timeout=30)
+                except subprocess.TimeoutExpired:
+                    proc.kill()
+
+    if len(results) > 1:
+        print_comparison(results)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,190 @@
+"""
+Benchmarks لـ load_excel_full / exclude_ajada_everywhere / prepare_df / build_options / build_data
+
+يسجل الوقت (median من عدة تكرارات) وذروة الذاكرة (tracemalloc في تشغيل منفصل)،
+ويقارنها بملف baseline JSON؛ يفشل (exit 1) لو أي قياس تجاوز الـ baseline بأكثر من --margin،
+و(exit 2) لو ما فيه baseline أصلاً وما انطلب --save.
+
+    python -m bench.run --sizes 10k,100k
+    python -m bench.run --sizes 10k,100k --save          # تحديث الـ baseline
+    python -m bench.run --sizes 1m --margin 0.5 --only build_data
+"""
+from __future__ import annotations
+
+import os
+import sys
+import gc
+import json
+import time
+import argparse
+import platform
+import statistics
+import tracemalloc
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+os.environ.setdefault("WARMUP_ON_BOOT", "0")  # لا نبغى تحميل الملف الحقيقي وقت import
+
+import app  # noqa: E402
+from bench import synth  # noqa: E402
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), "baseline.json")
+DEFAULT_MARGIN = 0.25
+MB = 1024 * 1024
+
+
+def _filter_combos(df) -> List[Tuple[str, str, str, str]]:
+    """
+    تركيبات فلاتر ممثلة: الكل، بلدية كبيرة، بلدية + إدارة، نوع محدد، تركيبة فاضية
+    """
+    opts = app.build_options(df)
+    top_muni = df[app.COL_MUNI].value_counts().index[0]
+    top_dept = df[app.COL_DEPT].value_counts().index[0]
+    top_type = df[app.COL_TYPE].value_counts().index[0]
+    rare_muni = opts["municipalities"][-1]
+    return [
+        ("all", "ALL", "ALL", "ALL"),
+        ("muni", top_muni, "ALL", "ALL"),
+        ("muni+dept", top_muni, top_dept, "ALL"),
+        ("type", "ALL", "ALL", top_type),
+        ("muni+dept+type", rare_muni, top_dept, top_type),
+        ("empty", "بلدية غير موجودة", "ALL", "ALL"),
+    ]
+
+
+def measure(fn: Callable[[], Any], repeat: int) -> Dict[str, float]:
+    times = []
+    for _ in range(repeat):
+        gc.collect()
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "seconds": round(statistics.median(times), 6),
+        "min_seconds": round(min(times), 6),
+        "peak_mb": round(peak / MB, 3),
+    }
+
+
+def run_size(size: str, repeat: int, seed: int, only: Optional[List[str]]) -> Dict[str, Dict[str, float]]:
+    results: Dict[str, Dict[str, float]] = {}
+
+    def bench(name: str, fn: Callable[[], Any], n: int = repeat) -> None:
+        if only and name.split("[")[0] not in only:
+            return
+        key = f"{size}/{name}"
+        results[key] = r = measure(fn, n)
+        print(f"  {key:<45} {r['seconds'] * 1000:10.2f} ms   peak {r['peak_mb']:9.2f} MB", flush=True)
+
+    path = synth.workbook_path(size, seed)
+    if path is not None:
+        app.EXCEL_PATH = path
+        raw = app.load_excel_full()
+        # قراءة الإكسل بطيئة؛ تكرار واحد كافي للأحجام الكبيرة
+        bench("load_excel_full", app.load_excel_full, 1 if synth.SIZES[size] >= 100_000 else repeat)
+    else:
+        print(f"  {size}: أكبر من حد الإكسل، نبدأ من DataFrame بدل load_excel_full", flush=True)
+        raw = synth.make_frame(synth.SIZES[size], seed)
+        raw.columns = raw.columns.astype(str).str.strip()
+
+    bench("exclude_ajada_everywhere", lambda: app.exclude_ajada_everywhere(raw))
+    clean = app.exclude_ajada_everywhere(raw)
+    bench("prepare_df", lambda: app.prepare_df(clean))
+    df = app.prepare_df(clean)
+
+    bench("build_options", lambda: app.build_options(df))
+    for label, muni, dept, type_ in _filter_combos(df):
+        bench(f"build_data[{label}]", lambda m=muni, d=dept, t=type_: app.build_data(df, m, d, t))
+
+    return results
+
+
+def compare(results: Dict[str, Dict[str, float]], baseline: Dict[str, Dict[str, float]], margin: float) -> List[str]:
+    failures = []
+    for key, r in results.items():
+        b = baseline.get(key)
+        if not b:
+            continue
+        for metric in ("seconds", "peak_mb"):
+            if b.get(metric) and r[metric] > b[metric] * (1 + margin):
+                failures.append(f"{key} {metric}: {r[metric]} > {b[metric]} (+{margin:.0%})")
+    return failures
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="benchmarks لمسار البيانات")
+    ap.add_argument("--sizes", default="10k,100k", help=f"من {','.join(synth.SIZES)}")
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--only", default="", help="أسماء دوال مفصولة بفاصلة")
+    ap.add_argument("--baseline", default=DEFAULT_BASELINE)
+    ap.add_argument("--margin", type=float, default=float(os.environ.get("BENCH_MARGIN", DEFAULT_MARGIN)),
+                    help="نسبة التجاوز المسموحة عن الـ baseline (0.25 = 25%%)")
+    ap.add_argument("--save", action="store_true", help="كتابة النتائج كـ baseline جديد")
+    ap.add_argument("--out", default=None, help="حفظ نتائج هذا التشغيل في JSON")
+    args = ap.parse_args(argv)
+
+    sizes = [s.strip() for s in args.sizes.split(",") if s.strip()]
+    unknown = [s for s in sizes if s not in synth.SIZES]
+    if unknown:
+        ap.error(f"أحجام غير معروفة: {unknown}")
+    only = [s.strip() for s in args.only.split(",") if s.strip()] or None
+
+    results: Dict[str, Dict[str, float]] = {}
+    for size in sizes:
+        print(f"[{size}]", flush=True)
+        results.update(run_size(size, args.repeat, args.seed, only))
+
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "pandas": app.pd.__version__,
+            "machine": platform.machine(),
+            "at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "repeat": args.repeat,
+        },
+        "results": results,
+    }
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+    if args.save:
+        old = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline, encoding="utf-8") as f:
+                old = json.load(f).get("results", {})
+        old.update(results)
+        report["results"] = old
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2, sort_keys=True)
+        print(f"baseline saved → {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        # ✅ بدون baseline ما نقدر نحكم، فنفشل بدل ما نعدّي بصمت (في CI أو checkout جديد)
+        print(f"FAIL: لا يوجد baseline في {args.baseline} (شغّل مع --save أول مرة)")
+        return 2
+
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f).get("results", {})
+    failures = compare(results, baseline, args.margin)
+    if failures:
+        print("\nREGRESSIONS:")
+        for line in failures:
+            print("  " + line)
+        return 1
+    print(f"\nOK: كل القياسات ضمن +{args.margin:.0%} من الـ baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,168 @@
+"""
+توليد ملفات اعتراضات وهمية بقيم عربية قريبة من الواقع:
+بلديات بأشكال همزة مختلفة، إدارات، أنواع رقابة (توزيع طويل الذيل)، حالات،
+صفوف فيها إجادة بكل أشكالها، وتواريخ "وسخة" (نصوص، فراغات، خارج السنة).
+"""
+from __future__ import annotations
+
+import os
+import sys
+import argparse
+from datetime import datetime
+from typing import Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+SIZES: Dict[str, int] = {
+    "10k": 10_000,
+    "100k": 100_000,
+    "1m": 1_000_000,
+    "5m": 5_000_000,
+}
+
+# حد صفوف الشيت في الإكسل (ناقص سطر العناوين) — الأحجام الأكبر تتقاس من DataFrame مباشرة
+XLSX_MAX_ROWS = 1_048_575
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "data")
+
+MUNIS = [
+    "أمانة الأحساء", "امانة الاحساء", "بلدية الهفوف", "بلدية المبرز", "بلدية العيون",
+    "بلدية الجفر", "بلدية العمران", "بلدية الطرف", "بلدية الشعبة", "بلدية القرين",
+    "بلدية الجشة", "بلدية المنيزلة", "بلدية البطالية", "بلدية الحليلة", "بلدية الكلابية",
+    "بلدية أبو الحصى", "بلدية ابو الحصى", "بلدية العضيلية", "بلدية يبرين", "بلدية الجبيل",
+]
+
+DEPTS = [
+    "إدارة الرقابة الصحية", "ادارة الرقابة الصحية", "إدارة الرخص التجارية", "إدارة الإنشاءات",
+    "إدارة النظافة", "إدارة الأسواق", "إدارة الحدائق", "إدارة التعديات", "إدارة اللوحات",
+    "إدارة الخدمات البلدية",
+]
+
+_BASE_TYPES = [
+    "رقابة صحية", "رقابة تجارية", "رقابة إنشائية", "رقابة بيئية", "رقابة اللوحات",
+    "رقابة المطاعم", "رقابة الأسواق الشعبية", "رقابة المسالخ", "رقابة المباني تحت الإنشاء",
+    "رقابة الحفريات", "رقابة الباعة الجائلين", "رقابة المستودعات", "رقابة الصالونات",
+    "رقابة المخابز", "رقابة محطات الوقود", "رقابة الورش",
+]
+TYPES = _BASE_TYPES + [f"{t} - فرعي {i}" for i in range(1, 6) for t in _BASE_TYPES]
+
+STATUSES = ["مكتمل - مقبول", "مكتمل - مرفوض", "قيد الدراسة", "قيد المراجعة", "معاد للمستفيد"]
+STATUS_WEIGHTS = [0.38, 0.32, 0.15, 0.1, 0.05]
+
+AJADA_VALUES = ["برنامج إجادة", "اجادة", "جولة إجاده", "اجاده - متابعة"]
+AJADA_RATE = 0.03
+
+FACILITIES = ["مؤسسة النخبة", "شركة البناء الحديث", "مطعم الواحة", "مخبز الأسرة", "محطة الشرق", "ورشة الأمانة"]
+VIOLATIONS = ["عدم وجود شهادة صحية", "لوحة مخالفة", "تعدي على الرصيف", "انتهاء الرخصة", "مخلفات بناء", "تخزين غير نظامي"]
+
+OTHER_TYPE = "نوع رقابه غير محدد"
+
+
+def _zipf_weights(n: int, s: float = 1.1) -> np.ndarray:
+    w = 1.0 / np.arange(1, n + 1) ** s
+    return w / w.sum()
+
+
+def _messy_dates(rng: np.random.Generator, n: int) -> np.ndarray:
+    start = np.datetime64("2024-11-01")
+    days = rng.integers(0, 430, size=n)
+    ts = (start + days.astype("timedelta64[D]")).astype("datetime64[s]")
+    ts = ts + rng.integers(7 * 3600, 17 * 3600, size=n).astype("timedelta64[s]")
+
+    out = ts.astype(object)
+    kind = rng.random(n)
+    iso = kind < 0.08
+    slash = (kind >= 0.08) & (kind < 0.13)
+    empty = (kind >= 0.13) & (kind < 0.17)
+    junk = (kind >= 0.17) & (kind < 0.19)
+
+    as_dt = pd.to_datetime(ts)
+    out[iso] = as_dt[iso].strftime("%Y-%m-%d")
+    out[slash] = as_dt[slash].strftime("%d/%m/%Y")
+    out[empty] = None
+    out[junk] = "غير محدد"
+    plain = ~(iso | slash | empty | junk)
+    out[plain] = [x.to_pydatetime() for x in as_dt[plain]]
+    return out
+
+
+def make_frame(n: int, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+
+    types = np.array(TYPES, dtype=object)[rng.choice(len(TYPES), size=n, p=_zipf_weights(len(TYPES)))]
+    notes = np.array(VIOLATIONS, dtype=object)[rng.integers(0, len(VIOLATIONS), size=n)]
+
+    # إجادة تظهر مرة في نوع الرقابة ومرة في الملاحظات (عشان الحذف يفحص كل الأعمدة)
+    ajada = rng.random(n) < AJADA_RATE
+    in_type = ajada & (rng.random(n) < 0.5)
+    in_notes = ajada & ~in_type
+    types[in_type] = np.array(AJADA_VALUES, dtype=object)[rng.integers(0, len(AJADA_VALUES), size=int(in_type.sum()))]
+    notes[in_notes] = np.array(AJADA_VALUES, dtype=object)[rng.integers(0, len(AJADA_VALUES), size=int(in_notes.sum()))]
+
+    return pd.DataFrame({
+        "رقم الاعتراض": np.arange(1, n + 1),
+        "تاريخ تقديم الاعتراض": _messy_dates(rng, n),
+        "اسم البلدية": np.array(MUNIS, dtype=object)[rng.choice(len(MUNIS), size=n, p=_zipf_weights(len(MUNIS), 0.8))],
+        "اسم الادارة": np.array(DEPTS, dtype=object)[rng.integers(0, len(DEPTS), size=n)],
+        "نوع الرقابة": types,
+        "حالة الاعتراض": np.array(STATUSES, dtype=object)[rng.choice(len(STATUSES), size=n, p=STATUS_WEIGHTS)],
+        "اسم المنشأة": np.array(FACILITIES, dtype=object)[rng.integers(0, len(FACILITIES), size=n)],
+        "ملاحظات": notes,
+    })
+
+
+def write_xlsx(df: pd.DataFrame, path: str) -> None:
+    """
+    كتابة بوضع write_only في openpyxl (الذاكرة ثابتة تقريباً حتى مع مليون صف)
+    """
+    from openpyxl import Workbook
+
+    if len(df) > XLSX_MAX_ROWS:
+        raise ValueError(f"الإكسل ما يتحمل أكثر من {XLSX_MAX_ROWS} صف في الشيت")
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Sheet1")
+    ws.append(list(df.columns))
+    for row in df.itertuples(index=False, name=None):
+        ws.append([None if (isinstance(v, float) and np.isnan(v)) else v for v in row])
+    wb.save(path)
+
+
+def workbook_path(size: str, seed: int = 0, data_dir: str = DATA_DIR) -> Optional[str]:
+    """
+    يرجّع مسار ملف الإكسل الوهمي (ويولّده أول مرة). None لو الحجم أكبر من حد الإكسل.
+    """
+    n = SIZES[size]
+    if n > XLSX_MAX_ROWS:
+        return None
+    path = os.path.join(data_dir, f"objections_{size}_s{seed}.xlsx")
+    if not os.path.exists(path):
+        write_xlsx(make_frame(n, seed), path + ".tmp")
+        os.replace(path + ".tmp", path)
+    return path
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="توليد ملف اعتراضات وهمي")
+    ap.add_argument("size", choices=list(SIZES))
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--out", default=None, help="المسار (الافتراضي bench/data/)")
+    args = ap.parse_args(argv)
+
+    t0 = datetime.now()
+    if args.out:
+        write_xlsx(make_frame(SIZES[args.size], args.seed), args.out)
+        path = args.out
+    else:
+        path = workbook_path(args.size, args.seed)
+        if path is None:
+            print(f"{args.size}: أكبر من حد الإكسل ({XLSX_MAX_ROWS} صف)، يتقاس من DataFrame مباشرة")
+            return 1
+    print(f"{path}  ({(datetime.now() - t0).total_seconds():.1f}s)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,16 @@
+# إعدادات gunicorn (تنقرأ تلقائياً لما نشغّل `gunicorn app:app` من مجلد المشروع)
+# ملاحظة: /events (SSE) يخلي الاتصال مفتوح لكل شاشة عرض (/?live=1)، عشان كذا:
+#   - الافتراضي gevent لو مثبّت (requirements.txt): كل اتصال greenlet رخيص، والتحميل الثقيل
+#     (warm-up وإعادة التحميل) يشتغل في thread نظام عشان ما يوقف الـ event loop
+#   - مع gthread كل اتصال يحجز thread، فـ EVENTS_MAX_CLIENTS الافتراضي ربع WEB_THREADS
+#     والزايد ياخذ 503 (عشان يبقى فيه threads لـ /healthz وباقي الطلبات)
+import os
+import importlib.util
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+worker_class = os.environ.get("WEB_WORKER_CLASS") or ("gevent" if importlib.util.find_spec("gevent") else "gthread")
+workers = int(os.environ.get("WEB_CONCURRENCY", "1"))
+threads = int(os.environ.get("WEB_THREADS", "16"))  # gthread فقط
+worker_connections = int(os.environ.get("WEB_WORKER_CONNECTIONS", "1000"))  # gevent فقط
+timeout = int(os.environ.get("WEB_TIMEOUT", "120"))
+keepalive = 5